@@ -11,71 +11,231 @@
 #    - Ready for live hosting
 #    - Changed the tts to use official gtts
 #    - Refactored to remove repetitive code and better organization of sections
+#    - App factory; Google SDKs, clients and the DB pool load on first use
+#    - Each create_app() gets its own pool, caches and job queue from app.config
+#    - Homepage built from cached per-book cards; fingerprinted assets under /assets/
 #===============================================
 
 #app.py
 import os
 import json
+import base64
+import codecs
+import math
+import hmac
+import hashlib
+import mimetypes
+import time
 import tempfile
-import shutil
 import logging
-from datetime import timedelta
+import threading
+import functools
+from datetime import date, timedelta
 from contextlib import contextmanager
 
 from flask import (
-    Flask, render_template, request, abort,
-    redirect, url_for, jsonify, make_response
+    Flask, Blueprint, Response, current_app, get_template_attribute, render_template, stream_template, request,
+    stream_with_context, abort, redirect, url_for, jsonify, send_from_directory
 )
+from werkzeug.datastructures import ContentRange
+from werkzeug.http import is_resource_modified
+from werkzeug.local import LocalProxy
+import click
 from dotenv import load_dotenv
-import google.generativeai as genai
-from google.cloud import texttospeech, storage
-import psycopg2.pool
+from markupsafe import Markup, escape
+
+from assets import ENCODINGS, Manifest
+from audio_cache import AudioCache, cache_key
+from tts_pipeline import MAX_CHUNK_BYTES, split_text, iter_synthesized
+from jobs import JobQueue
+from db_pool import ConnectionPool, PoolTimeout
+from cache import LRUCache, ReadThroughCache, make_shared_backend
+from metrics import REGISTRY, TimedCursor, begin_trace, end_trace, span, timed
 
 # Configuration & Clients
 load_dotenv(override=True)
 
+# Defaults for create_app(); the DATABASE_URL, pool, cache and queue settings
+# can be overridden per app through its config
 DATABASE_URL = os.getenv("DATABASE_URL", "")
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL is not set.")
+
+TTS_LANGUAGE = "en-US"
+TTS_GENDER = "NEUTRAL"
+TTS_ENCODING = "MP3"
+TTS_CHUNK_BYTES = min(int(os.getenv("TTS_CHUNK_BYTES", MAX_CHUNK_BYTES)), MAX_CHUNK_BYTES)
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "24"))
+MAX_PAGE_SIZE = 100
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+TEXT_CHUNK_BYTES = int(os.getenv("TEXT_CHUNK_BYTES", str(256 * 1024)))
+TEXT_BUFFER_BYTES = max(int(os.getenv("TEXT_BUFFER_BYTES", str(4 * 1024 * 1024))), TEXT_CHUNK_BYTES)
+AUDIO_STREAM_WAIT = float(os.getenv("AUDIO_STREAM_WAIT", "60"))
+AUDIO_STREAM_READ_BYTES = 64 * 1024
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_MB", "64")) * 1024 * 1024
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ITEM_BYTES = int(os.getenv("CACHE_MAX_ITEM_BYTES", str(256 * 1024)))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_MB", "512")) * 1024 * 1024
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+ASSET_MAX_AGE = 365 * 24 * 3600
+CARD_TTL = 24 * 3600
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
 
 RAW_KEY = os.getenv("GCP_SERVICE_ACCOUNT_JSON", "").strip()
 USE_GCS = False
+GCS_BUCKET = ""
 if RAW_KEY:
     try:
         creds = json.loads(RAW_KEY)
         USE_GCS = True
-        tf = tempfile.NamedTemporaryFile(delete=False, suffix=".json")
-        tf.write(json.dumps(creds).encode())
-        tf.close()
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = tf.name
-
         GCS_BUCKET = os.getenv("GCS_BUCKET_NAME")
         if not GCS_BUCKET:
             raise RuntimeError("GCS_BUCKET_NAME not set")
-        gcs_client = storage.Client()
-        bucket = gcs_client.bucket(GCS_BUCKET)
     except json.JSONDecodeError:
         USE_GCS = False
 
-tts_client = texttospeech.TextToSpeechClient()
-db_pool = psycopg2.pool.SimpleConnectionPool(1, 5, dsn=DATABASE_URL)
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+def once(fn):
+    """
+    Calls `fn()` on first use only, thread-safe, and returns that result after.
+    Keeps SDK imports and client construction off the import / boot path.
+    """
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(fn)
+    def wrapper():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(fn())
+        return result[0]
+    wrapper.ready = lambda: bool(result)
+    return wrapper
+
+@once
+def google_credentials():
+    """Writes GCP_SERVICE_ACCOUNT_JSON to a file for the Google SDKs to pick up."""
+    if USE_GCS:
+        tf = tempfile.NamedTemporaryFile(delete=False, suffix=".json")
+        tf.write(json.dumps(creds).encode())
+        tf.close()
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = tf.name
+
+def connect_db_pool(config):
+    """Database pool for an app's config; DATABASE_URL is only required here, on first use."""
+    url = config["DATABASE_URL"]
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    if not url:
+        raise RuntimeError("DATABASE_URL is not set.")
+    return ConnectionPool(
+        url,
+        minconn=config["DB_POOL_MIN"],
+        maxconn=config["DB_POOL_MAX"],
+        timeout=config["DB_POOL_TIMEOUT"],
+        max_lifetime=config["DB_POOL_MAX_LIFETIME"]
+    )
+
+def connect_tts():
+    from google.cloud import texttospeech
+    google_credentials()
+    return texttospeech.TextToSpeechClient()
+
+def connect_bucket(name):
+    from google.cloud import storage
+    google_credentials()
+    return storage.Client().bucket(name)
+
+def connect_gemini():
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel("gemini-1.5-flash")
+
+def client_getter(client, connect):
+    """once(connect), or a getter returning `client` as-is when one was given."""
+    return once(connect if client is None else lambda: client)
+
+
+class Services:
+    """
+    One app's database pool, caches, job queue and clients, built by
+    create_app() from app.config and kept in app.extensions["ebooks"].
+    Clients and the audio cache (which creates its directory) are zero-argument
+    getters, built on first call; clients handed to create_app() (e.g. stubs
+    in tests) are used instead of the real ones.
+    """
+
+    def __init__(self, app, db_pool=None, tts_client=None, bucket=None, gemini_model=None):
+        config = app.config
+        self.db_pool = client_getter(db_pool, lambda: connect_db_pool(config))
+        self.tts_client = client_getter(tts_client, connect_tts)
+        self.bucket = client_getter(bucket, lambda: connect_bucket(config["GCS_BUCKET"]))
+        self.gemini_model = client_getter(gemini_model, connect_gemini)
+        self.audio_cache = once(lambda: AudioCache(
+            config["AUDIO_CACHE_DIR"],
+            config["AUDIO_CACHE_MAX_BYTES"],
+            bucket=(self.bucket if config["USE_GCS"] else None)
+        ))
+        self.page_cache = ReadThroughCache(
+            LRUCache(config["CACHE_MAX_BYTES"], config["CACHE_TTL"]),
+            make_shared_backend(config["CACHE_URL"])
+        )
+        # Workers run each job inside this app's context, so handlers see its services
+        self.job_queue = JobQueue(db_cursor, workers=config["JOB_WORKERS"], context=app.app_context)
+        self.job_queue.handler("generate")(generate_job)
+        self.job_queue.handler("audio")(audio_job)
+
+
+def services():
+    """Services of the app serving the current request, job or CLI command."""
+    return current_app.extensions["ebooks"]
+
+def get_db_pool():
+    return services().db_pool()
+
+def get_tts_client():
+    return services().tts_client()
 
-app = Flask(__name__)
-app.logger.setLevel(logging.INFO)
+def get_bucket():
+    return services().bucket()
+
+def get_gemini_model():
+    return services().gemini_model()
+
+# The current app's caches and queue, so the helpers below need no app argument
+page_cache = LocalProxy(lambda: services().page_cache)
+audio_cache = LocalProxy(lambda: services().audio_cache())
+job_queue = LocalProxy(lambda: services().job_queue)
+
+asset_manifest = Manifest(os.path.join(ROOT, "static", "dist"))
 
 
 # Helpers
 @contextmanager
 def db_cursor():
-    conn = db_pool.getconn()
+    """
+    Cursor on a pooled connection; commits on success. On an exception the
+    pool rolls the transaction back, and drops the connection if it broke.
+    """
+    with span("db", "pool_wait"):
+        conn = get_db_pool().getconn()
     try:
-        cur = conn.cursor()
+        cur = conn.cursor(cursor_factory=TimedCursor)
         yield cur
         conn.commit()
     finally:
-        db_pool.putconn(conn)
+        get_db_pool().putconn(conn)
 
 def fetch_all(sql, *params):
     with db_cursor() as cur:
@@ -87,163 +247,865 @@ def fetch_one(sql, *params):
         cur.execute(sql, params)
         return cur.fetchone()
 
-def synthesize(text, out_path):
-    """Uses Cloud TTS to synthesize `text` into an MP3 at `out_path`."""
+def fetch_book_meta(book_id):
+    """(title, updated_at, content size in bytes) without loading the content."""
+    return page_cache.get_or_load(f"book:{book_id}:meta", lambda: fetch_one(
+        "SELECT title, updated_at, COALESCE(octet_length(content), 0) "
+        "FROM books WHERE book_id = %s",
+        book_id
+    ))
+
+def fetch_book(book_id):
+    """(title, content) for a book; cached unless the content is very large."""
+    return page_cache.get_or_load(
+        f"book:{book_id}:row",
+        lambda: fetch_one("SELECT title, content FROM books WHERE book_id = %s", book_id),
+        cacheable=lambda row: (row is not None
+                               and len(row[1] or "") <= current_app.config["CACHE_MAX_ITEM_BYTES"])
+    )
+
+def invalidate_book(book_id):
+    """Drops cached rows for a book whose title or content changed."""
+    page_cache.invalidate(f"book:{book_id}:meta", f"book:{book_id}:row")
+    invalidate_listing()
+
+def invalidate_listing():
+    """Drops the cached homepage after a new book or review."""
+    page_cache.invalidate("page:index")
+
+def iter_book_bytes(book_id, updated_at, start, stop):
+    """
+    Yields bytes [start, stop) of a book's UTF-8 content, TEXT_CHUNK_BYTES at a
+    time. Chunks are fetched TEXT_BUFFER_BYTES at a time on a short pool
+    checkout that ends before they are sent, so slow clients hold neither a
+    connection nor a snapshot. Each fetch converts the book once and slices
+    the result, so the whole stream costs about stop / TEXT_BUFFER_BYTES
+    conversions. Fetches are pinned to the version the response was built
+    for; if the book has been edited since, it stops early.
+    """
+    sent = start
+    while sent < stop:
+        end = min(stop, sent + TEXT_BUFFER_BYTES)
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT substring(doc.bytes FROM pos FOR LEAST(%(chunk)s, %(stop)s - pos + 1))
+                  FROM (SELECT convert_to(content, 'UTF8') AS bytes
+                          FROM books
+                         WHERE book_id = %(book_id)s AND updated_at = %(updated_at)s
+                        OFFSET 0) doc,
+                       LATERAL generate_series(%(start)s + 1,
+                                               LEAST(%(stop)s, octet_length(doc.bytes)),
+                                               %(chunk)s) pos
+              ORDER BY pos
+            """, {"book_id": book_id, "updated_at": updated_at, "start": sent,
+                  "stop": end, "chunk": TEXT_CHUNK_BYTES})
+            buffered = [bytes(data) for (data,) in cur.fetchall()]
+        for data in buffered:
+            yield data
+            sent += len(data)
+        if sent < end:
+            break
+    if sent < stop:
+        log.warning("Book %s changed while streaming", book_id)
+        invalidate_book(book_id)
+
+def iter_book_text(book_id, updated_at, size):
+    """Same as iter_book_bytes() for the whole book, decoded to str chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for data in iter_book_bytes(book_id, updated_at, 0, size):
+        yield decoder.decode(data)
+    yield decoder.decode(b"", final=True)
+
+def content_etag(book_id, updated_at, size):
+    """Strong validator for a book's content version."""
+    return f"book{book_id}-{int(updated_at.timestamp() * 1_000_000):x}-{size:x}"
+
+def not_modified(etag, last_modified):
+    """True when the client's If-None-Match / If-Modified-Since still matches."""
+    return not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+def requested_range(size, etag, last_modified):
+    """
+    (start, stop) for a single satisfiable byte Range, or None to send the
+    whole body. Honours If-Range; aborts with 416 for unsatisfiable ranges.
+    """
+    rng = request.range
+    if rng is None or rng.units != "bytes" or len(rng.ranges) != 1:
+        return None
+    if_range = request.if_range
+    if if_range.etag and if_range.etag != etag:
+        return None
+    if if_range.date and last_modified.replace(microsecond=0) > if_range.date:
+        return None
+    byte_range = rng.range_for_length(size)
+    if byte_range is None:
+        resp = Response(status=416)
+        resp.content_range = ContentRange("bytes", None, None, size)
+        abort(resp)
+    return byte_range
+
+@timed("tts", "synthesize_chunk", size=len)
+def synthesize_chunk(text, client):
+    """Single Cloud TTS request; `text` must fit within TTS_CHUNK_BYTES."""
+    from google.cloud import texttospeech
     inp = texttospeech.SynthesisInput(text=text)
     voice = texttospeech.VoiceSelectionParams(
-        language_code="en-US",
-        ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
+        language_code=TTS_LANGUAGE,
+        ssml_gender=texttospeech.SsmlVoiceGender[TTS_GENDER]
     )
-    cfg = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
-    resp = tts_client.synthesize_speech(input=inp, voice=voice, audio_config=cfg)
-    with open(out_path, "wb") as f:
-        f.write(resp.audio_content)
-    app.logger.info(f"TTS → {out_path} ({len(resp.audio_content)} bytes)")
-
-def get_signed_url(filename, expiry=timedelta(hours=1)):
-    blob = bucket.blob(filename)
+    cfg = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding[TTS_ENCODING])
+    resp = client.synthesize_speech(input=inp, voice=voice, audio_config=cfg)
+    return resp.audio_content
+
+def iter_audio(text, chunks=None):
+    """Yields MP3 bytes for `text` in order, rendering chunks in parallel."""
+    if chunks is None:
+        chunks = split_text(text, TTS_CHUNK_BYTES)
+    # Looked up here: the pool threads that render chunks have no app context
+    client = get_tts_client()
+    return iter_synthesized(chunks, lambda chunk: synthesize_chunk(chunk, client), TTS_WORKERS)
+
+def synthesize(text, out_path, progress=None):
+    """
+    Uses Cloud TTS to synthesize `text` into an MP3 at `out_path`.
+    `progress(fraction)` is called after each chunk when given.
+    """
+    chunks = split_text(text, TTS_CHUNK_BYTES)
+    total = 0
+    with span("tts", "synthesize") as s, open(out_path, "wb") as f:
+        for i, data in enumerate(iter_audio(text, chunks), start=1):
+            f.write(data)
+            f.flush()  # readers may be tailing the file
+            total += len(data)
+            if progress:
+                progress(i / len(chunks))
+        s.bytes = total
+    log.info(f"TTS → {out_path} ({total} bytes)")
+
+def render_audio(text, filename, progress=None):
+    """
+    Synthesizes `text` and stores the MP3 in the audio cache as `filename`.
+    Chunks are written to the cache's partial file as they finish, so
+    tail_render() can stream the render while it is still running.
+    """
+    partial = audio_cache.partial_path(filename)
+    remove_file(partial)  # an earlier attempt's leftovers; its readers see a new file
+    try:
+        synthesize(text, partial, progress)
+        return audio_cache.put(filename, partial)
+    finally:
+        remove_file(partial)
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def tail_render(filename, job_id):
+    """
+    Yields the MP3 of an audio job while it renders, by following the partial
+    file the job writes, so listening now costs no second TTS render. Stops
+    once the file has moved into the cache (or a retry replaced it), when the
+    job fails, or after AUDIO_STREAM_WAIT seconds without new audio.
+    """
+    partial = audio_cache.partial_path(filename)
+    f, inode, final = None, None, False
+    last_data = last_check = time.monotonic()
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(partial, "rb")
+                except FileNotFoundError:
+                    if audio_cache.get(filename):  # finished before we got here
+                        f, final = open(audio_cache.local_path(filename), "rb"), True
+                if f is not None:
+                    inode = os.fstat(f.fileno()).st_ino
+            data = f.read(AUDIO_STREAM_READ_BYTES) if f is not None else b""
+            if data:
+                last_data = time.monotonic()
+                yield data
+                continue
+            if f is not None and (final or not same_inode(partial, inode)):
+                # Moved into the cache or replaced: drain what was written before that
+                yield from iter(lambda: f.read(AUDIO_STREAM_READ_BYTES), b"")
+                return
+            now = time.monotonic()
+            if now - last_data > AUDIO_STREAM_WAIT:
+                log.warning("Audio stream for job %s timed out waiting for audio", job_id)
+                return
+            if now - last_check > 2:
+                last_check = now
+                job = job_queue.get(job_id)
+                if job is None or job["status"] == "failed":
+                    return
+                if job["status"] == "done" and f is None and not audio_cache.get(filename):
+                    return
+            time.sleep(0.2)
+    finally:
+        if f is not None:
+            f.close()
+
+def same_inode(path, inode):
+    try:
+        return os.stat(path).st_ino == inode
+    except FileNotFoundError:
+        return False
+
+def audio_cache_key(text):
+    """Cache key for `text` rendered with the current voice settings."""
+    return cache_key(text, f"{TTS_LANGUAGE}/{TTS_GENDER}", TTS_ENCODING)
+
+def cached_audio_url(filename, book_id):
+    """Public URL for an MP3 that is already in the audio cache."""
+    if current_app.config["USE_GCS"]:
+        return get_signed_url(audio_cache.blob_name(filename), download_name=f"book_{book_id}.mp3")
+    return url_for("main.audio_file", filename=filename)
+
+@timed("gcs", "sign_url")
+def get_signed_url(filename, expiry=timedelta(hours=1), download_name=None):
+    blob = get_bucket().blob(filename)
     return blob.generate_signed_url(
         expiration=expiry,
         version="v4",
-        response_disposition=f'attachment; filename="{filename}"'
+        response_disposition=f'attachment; filename="{download_name or filename}"'
     )
 
-def upload_to_gcs(local_path, filename):
-    blob = bucket.blob(filename)
-    blob.upload_from_filename(local_path)
-    return get_signed_url(filename)
+@timed("gemini", "generate", size=len)
+def generate_story(theme):
+    """Asks Gemini for a short story titled `theme`."""
+    return get_gemini_model().generate_content(
+        f"Write a creative short story (~500 words) titled '{theme}'."
+    ).text.strip()
 
+def save_story(theme, story):
+    """Inserts a generated story under the 'Gemini AI' author; returns the book_id."""
+    with db_cursor() as cur:
+        cur.execute("SELECT author_id FROM authors WHERE name=%s", ("Gemini AI",))
+        r = cur.fetchone()
+        if r:
+            aid = r[0]
+        else:
+            cur.execute(
+                "INSERT INTO authors(name) VALUES(%s) RETURNING author_id",
+                ("Gemini AI",)
+            )
+            aid = cur.fetchone()[0]
 
-# Routes
-@app.route("/")
-def index():
+        cur.execute(
+            "INSERT INTO books(title,content,genre,published_date,author_id) "
+            "VALUES(%s,%s,%s,CURRENT_DATE,%s) RETURNING book_id",
+            (theme, story, "Fiction", aid)
+        )
+        book_id = cur.fetchone()[0]
+    invalidate_listing()
+    return book_id
+
+def render_book_cards(rows):
+    """
+    Listing cards as HTML. Each card is cached under the values it shows, so
+    after a new book or review only the cards whose row changed render again.
+    A key never goes stale, hence the long TTL; the LRU drops unused cards.
+    """
+    book_card = get_template_attribute("_book_card.html", "book_card")
+    return [
+        page_cache.get_or_load(
+            f"card:{row[0]}:{hashlib.sha256(repr(row).encode()).hexdigest()[:16]}",
+            lambda row=row: book_card(*row),
+            ttl=CARD_TTL
+        )
+        for row in rows
+    ]
+
+def wants_json():
+    return request.accept_mimetypes.best == "application/json"
+
+def encode_cursor(*values):
+    """Opaque, URL-safe page cursor for the given sort key values."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor, *fields):
+    """
+    Inverse of encode_cursor(). Each of `fields` checks and returns one decoded
+    value, raising ValueError / TypeError if it is wrong; a cursor that does not
+    decode to exactly those values aborts with 400 before it reaches SQL.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError("wrong number of cursor values")
+        return [check(value) for check, value in zip(fields, values)]
+    except (ValueError, TypeError):
+        abort(400, "Invalid cursor")
+
+def cursor_id(value):
+    """A SERIAL id: a JSON integer in Postgres' INTEGER range."""
+    if type(value) is not int or not 0 <= value < 2 ** 31:
+        raise ValueError("bad cursor id")
+    return value
+
+def cursor_date(value):
+    """An ISO date as written by fetch_books_page(), or '-infinity'."""
+    if value != "-infinity":
+        date.fromisoformat(value)
+    return value
+
+def cursor_rank(value):
+    """A search rank: a finite JSON number."""
+    if type(value) not in (int, float) or not math.isfinite(value):
+        raise ValueError("bad cursor rank")
+    return value
+
+def fetch_books_page(cursor=None, limit=PAGE_SIZE):
     """
-    Homepage: displays a list of all eBooks from the PostgreSQL database.
+    One page of the library listing, newest first.
+    Keyset pagination on (published_date, book_id) so every page is an index
+    range scan no matter how deep it is. Returns (rows, next_cursor).
     """
-    ebooks = fetch_all("""
+    where, params = "", []
+    if cursor:
+        published, book_id = decode_cursor(cursor, cursor_date, cursor_id)
+        where = ("WHERE (COALESCE(b.published_date, '-infinity'::date), b.book_id) "
+                 "< (%s::date, %s)")
+        params = [published, book_id]
+    rows = fetch_all(f"""
         SELECT b.book_id, b.title, a.name, b.genre, b.published_date,
-               AVG(r.rating) AS avg_rating, COUNT(r.review_id) AS total_reviews
+               br.rating_sum::numeric / NULLIF(br.rating_count, 0) AS avg_rating,
+               COALESCE(br.rating_count, 0) AS total_reviews
           FROM books b
           JOIN authors a USING (author_id)
-          LEFT JOIN reviews r USING (book_id)
-      GROUP BY b.book_id, b.title, a.name, b.genre, b.published_date
-      ORDER BY b.published_date DESC;
-    """)
+          LEFT JOIN book_ratings br USING (book_id)
+          {where}
+      ORDER BY COALESCE(b.published_date, '-infinity'::date) DESC, b.book_id DESC
+         LIMIT %s;
+    """, *params, limit + 1)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            last[4].isoformat() if last[4] else "-infinity", last[0]
+        )
+    return rows, next_cursor
+
+def search_books(query, cursor=None, limit=PAGE_SIZE):
+    """
+    Full-text search via the GIN-indexed title_vector and search_vector.
+    Candidates are the best SEARCH_MAX_CANDIDATES title matches plus the
+    SEARCH_MAX_CANDIDATES most recent text matches (highest book_id), so a
+    book whose title matches is not left out for being old and broad queries
+    do not score a large share of the catalog. Title matches rank first, by their
+    title rank; the rest by ts_rank_cd over the whole book. Both ranks are
+    scaled into [0, 1) (normalization 32), title ones shifted up by 1.
+    Results are paged with a keyset cursor on (rank, book_id); snippets are
+    only built for the returned page. The candidate set is deterministic, so
+    every page is cut from the same one.
+    Returns (rows, next_cursor, capped); each row ends with a highlighted
+    snippet, and `capped` says matches were left out.
+    """
+    where, params = "", []
+    if cursor:
+        rank, book_id = decode_cursor(cursor, cursor_rank, cursor_id)
+        where = "WHERE (rank, book_id) < (%s::real, %s)"
+        params = [rank, book_id]
+    # NOT MATERIALIZED: the query is inlined and folded to a constant, so the
+    # planner can use its selectivity
+    rows = fetch_all(f"""
+        WITH q AS NOT MATERIALIZED (SELECT websearch_to_tsquery('english', %s) AS query),
+        title_hits AS (
+            SELECT b.book_id, 1 + ts_rank_cd(b.title_vector, q.query, 32) AS rank
+              FROM books b, q
+             WHERE b.title_vector @@ q.query
+          ORDER BY rank DESC, b.book_id DESC
+             LIMIT %s
+        ),
+        text_hits AS (
+            SELECT b.book_id, ts_rank_cd(b.search_vector, q.query, 32) AS rank
+              FROM books b, q
+             WHERE b.search_vector @@ q.query
+          ORDER BY b.book_id DESC
+             LIMIT %s
+        ),
+        hits AS (
+            SELECT book_id, max(rank)::real AS rank
+              FROM (SELECT * FROM title_hits UNION ALL SELECT * FROM text_hits) c
+          GROUP BY book_id
+        )
+        SELECT b.book_id, b.title, a.name, b.genre, b.published_date, page.rank,
+               ts_headline('english', b.content, q.query,
+                           'StartSel=' || chr(1) || ', StopSel=' || chr(2) ||
+                           ', MaxFragments=2, MinWords=8, MaxWords=24, FragmentDelimiter=" … "'),
+               greatest((SELECT count(*) FROM title_hits), (SELECT count(*) FROM text_hits))
+          FROM (SELECT * FROM hits {where}
+              ORDER BY rank DESC, book_id DESC
+                 LIMIT %s) page
+          JOIN books b USING (book_id)
+          JOIN authors a USING (author_id)
+         CROSS JOIN q
+      ORDER BY page.rank DESC, b.book_id DESC;
+    """, query, SEARCH_MAX_CANDIDATES, SEARCH_MAX_CANDIDATES, *params, limit + 1)
+
+    capped = bool(rows) and rows[0][7] >= SEARCH_MAX_CANDIDATES
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][5], rows[-1][0])
+    return [(*row[:6], highlight(row[6])) for row in rows], next_cursor, capped
+
+def cache_metrics():
+    """Page cache counters for /metrics."""
+    stats = page_cache.stats()
+    for name in ("local_hits", "shared_hits", "misses", "invalidations", "shared_errors", "evictions"):
+        yield f"page_cache_{name}_total", "counter", f"Page cache {name.replace('_', ' ')}", stats[name]
+    for name in ("entries", "size_bytes", "max_bytes"):
+        yield f"page_cache_{name}", "gauge", f"Page cache {name.replace('_', ' ')}", stats[name]
+
+REGISTRY.add_collector(cache_metrics)
+
+def pool_metrics():
+    """Database pool size, utilization and wait counters for /metrics."""
+    if not services().db_pool.ready():
+        return
+    stats = get_db_pool().stats()
+    for name in ("size", "idle", "in_use", "waiting", "maxconn", "utilization"):
+        yield f"db_pool_{name}", "gauge", f"Database pool {name.replace('_', ' ')}", stats[name]
+    for name in ("checkouts", "waits", "wait_seconds", "timeouts", "created", "discarded",
+                 "rollbacks", "failed_checks"):
+        yield f"db_pool_{name}_total", "counter", f"Database pool {name.replace('_', ' ')}", stats[name]
+
+REGISTRY.add_collector(pool_metrics)
+
+def highlight(snippet):
+    """Escapes a ts_headline snippet, turning its chr(1)/chr(2) markers into <mark> tags."""
+    html = str(escape(snippet or ""))
+    return Markup(html.replace("\x01", "<mark>").replace("\x02", "</mark>"))
+
+
+# Background jobs, registered on each app's queue by Services
+def generate_job(job):
+    theme = job.payload["theme"]
+    story = generate_story(theme)
+    job.progress(0.9)
+    book_id = save_story(theme, story)
+    log.info("New story saved: %s", theme)
+    return {"book_id": book_id}
+
+def audio_job(job):
+    book_id = job.payload["book_id"]
+    row = fetch_book(book_id)
+    if not row:
+        raise LookupError(f"Book {book_id} not found")
+    filename = f"{audio_cache_key(row[1])}.mp3"
+    if not audio_cache.has(filename):
+        render_audio(row[1], filename, progress=job.progress)
+    return {"book_id": book_id, "filename": filename}
+
+
+# Routes
+bp = Blueprint("main", __name__, cli_group=None)
+
+
+def traced(wsgi_app, app):
+    """
+    Wraps `app.wsgi_app` in the per-request trace and records the request
+    metrics from its start_response(). Done in WSGI rather than request hooks
+    so this reads the environ and the response headers directly, with no
+    proxy lookups or hook dispatch. Send `X-Profile: <PROFILE_TOKEN>` (any
+    value in debug mode) to get a Server-Timing header and the call tree in
+    the log.
+    """
+    def traced_app(environ, start_response):
+        header = environ.get("HTTP_X_PROFILE")
+        if not header:
+            trace = begin_trace()
+        elif PROFILE_TOKEN:
+            trace = begin_trace(hmac.compare_digest(header.encode(), PROFILE_TOKEN.encode()))
+        else:
+            trace = begin_trace(app.debug)
+
+        def start_traced(status, headers, exc_info=None):
+            # Called inside the request context, once the response is built
+            elapsed = trace.elapsed()
+            size = None
+            for name, value in headers:
+                if name == "Content-Length":
+                    size = int(value)
+                    break
+            queries = trace.calls("db", "query")
+            req = environ["werkzeug.request"]  # the request object, without the proxy lookup
+            rule = req.url_rule
+            series = (_request_series.get((rule and rule.endpoint, req.method, status))
+                      or request_series(req, status))
+            REGISTRY.observe_later(series, (elapsed, queries) if size is None else (elapsed, queries, size))
+            if trace.profile:
+                headers.append(("Server-Timing", trace.server_timing(elapsed)))
+                log.info("Profile\n%s", trace.format_tree(
+                    f"{req.method} {req.full_path.rstrip('?')} {status[:3]}", elapsed
+                ))
+            return start_response(status, headers, exc_info)
+
+        try:
+            return wsgi_app(environ, start_traced)
+        finally:
+            end_trace()
+    return traced_app
+
+
+_request_series = {}
+
+def request_series(req, status):
+    """
+    The request histograms for one (endpoint, method, status line), built on
+    first use and then read straight from _request_series, so the route label
+    and series lookups stay off the per-request path.
+    """
+    rule = req.url_rule
+    key = (rule and rule.endpoint, req.method, status)
+    series = _request_series.get(key)
+    if series is None:
+        route = rule.rule if rule else "<unmatched>"
+        code = int(status[:3])
+        series = _request_series[key] = (
+            REGISTRY.series("http_request_duration_seconds", route, req.method, code),
+            REGISTRY.series("http_request_db_queries", route),
+            REGISTRY.series("http_response_size_bytes", route),
+        )
+    return series
+
+
+@bp.app_template_global()
+def asset_url(name):
+    """URL of a static file: its fingerprinted build if there is one, else /static/."""
+    entry = asset_manifest.get(name)
+    if entry is None:
+        return url_for("static", filename=name)
+    return url_for("main.asset", filename=entry["file"])
+
+
+@bp.app_errorhandler(PoolTimeout)
+def database_busy(e):
+    """Pool exhausted for DB_POOL_TIMEOUT seconds: shed load instead of queueing forever."""
+    log.warning("Database pool exhausted: %s", e)
+    return Response("Server busy, please retry.", status=503, headers={"Retry-After": "1"})
+
+
+@bp.before_app_request
+def start_job_workers():
+    # Started on first request rather than import, so CLI commands stay worker-free
+    if current_app.config["JOB_WORKERS"] > 0:
+        job_queue.start()
+
+
+@bp.route("/")
+def index():
+    """
+    Homepage: displays the first page of eBooks from the PostgreSQL database.
+    Rebuilt from cached cards after a change; repeat visits get a 304.
+    """
+    def render():
+        ebooks, next_cursor = fetch_books_page()
+        html = render_template(
+            "index.html",
+            cards=render_book_cards(ebooks),
+            next_cursor=next_cursor,
+            use_gcs=current_app.config["USE_GCS"],
+            bucket_name=(current_app.config["GCS_BUCKET"] if current_app.config["USE_GCS"] else "")
+        )
+        return html, hashlib.sha256(html.encode()).hexdigest()[:20]
+    html, etag = page_cache.get_or_load("page:index", render)
+    resp = Response(status=304) if not_modified(etag, None) else Response(html)
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp
+
+
+@bp.route("/api/books")
+def api_books():
+    """
+    JSON listing page: only the card columns, plus the cursor for the next page.
+    """
+    limit = min(max(request.args.get("limit", PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    rows, next_cursor = fetch_books_page(request.args.get("cursor"), limit)
+    books = [
+        {
+            "book_id": book_id,
+            "title": title,
+            "author": author,
+            "genre": genre,
+            "published_date": published.isoformat() if published else None,
+            "avg_rating": round(float(avg_rating), 2) if avg_rating is not None else None,
+            "total_reviews": total_reviews,
+            "read_url": url_for("main.read", book_id=book_id),
+            "audio_url": url_for("main.audio", book_id=book_id),
+        }
+        for book_id, title, author, genre, published, avg_rating, total_reviews in rows
+    ]
+    return jsonify(books=books, next_cursor=next_cursor)
+
+
+@bp.route("/search")
+def search():
+    """
+    Search results page, ranked, with highlighted snippets.
+    """
+    query = request.args.get("q", "").strip()
+    results, next_cursor, capped = ([], None, False)
+    if query:
+        results, next_cursor, capped = search_books(query, request.args.get("cursor"))
     return render_template(
-        "index.html",
-        ebooks=ebooks,
-        use_gcs=USE_GCS,
-        bucket_name=(GCS_BUCKET if USE_GCS else "")
+        "search.html",
+        query=query,
+        results=results,
+        next_cursor=next_cursor,
+        capped=capped,
+        max_candidates=SEARCH_MAX_CANDIDATES
     )
 
 
-@app.route("/read/<int:book_id>")
+@bp.route("/api/search")
+def api_search():
+    """
+    JSON search API: one ranked page plus the cursor for the next page.
+    """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify(results=[], next_cursor=None, capped=False)
+    limit = min(max(request.args.get("limit", PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    rows, next_cursor, capped = search_books(query, request.args.get("cursor"), limit)
+    results = [
+        {
+            "book_id": book_id,
+            "title": title,
+            "author": author,
+            "genre": genre,
+            "published_date": published.isoformat() if published else None,
+            "rank": rank,
+            "snippet": str(snippet),
+            "read_url": url_for("main.read", book_id=book_id),
+        }
+        for book_id, title, author, genre, published, rank, snippet in rows
+    ]
+    return jsonify(results=results, next_cursor=next_cursor, capped=capped)
+
+
+@bp.route("/read/<int:book_id>")
 def read(book_id):
     """
-    Read page: fetches title & content from the database.
+    Read page: small books come from the page cache, large ones are streamed
+    from the database in chunks.
+    Repeat visits revalidate with ETag / Last-Modified and get a 304.
     """
-    row = fetch_one("SELECT title, content FROM books WHERE book_id = %s", book_id)
-    if not row:
+    meta = fetch_book_meta(book_id)
+    if not meta:
         abort(404)
-    title, content = row
-    return render_template("read_book.html", title=title, content=content, book_id=book_id)
+    title, updated_at, size = meta
+    etag = content_etag(book_id, updated_at, size)
+    if not_modified(etag, updated_at):
+        resp = Response(status=304)
+    elif size <= current_app.config["CACHE_MAX_ITEM_BYTES"]:
+        # Small books: serve the rendered page from cache, keyed by content version
+        resp = Response(page_cache.get_or_load(
+            f"book:{book_id}:page:{etag}",
+            lambda: render_template(
+                "read_book.html", title=title, content=[fetch_book(book_id)[1] or ""], book_id=book_id
+            )
+        ))
+    else:
+        resp = Response(stream_template(
+            "read_book.html",
+            title=title,
+            content=iter_book_text(book_id, updated_at, size),
+            book_id=book_id
+        ))
+    resp.set_etag(etag)
+    resp.last_modified = updated_at
+    resp.cache_control.no_cache = True
+    return resp
 
 
-@app.route("/audio/<int:book_id>")
+@bp.route("/audio/<int:book_id>")
 def audio(book_id):
     """
-    Generate (if needed) and serve audio via GCS or local fallback.
+    Audio player page: plays from the cache, or queues a render job on a miss.
     """
-    row = fetch_one("SELECT title, content FROM books WHERE book_id = %s", book_id)
+    row = fetch_book(book_id)
     if not row:
         abort(404)
     title, text = row
     if not text.strip():
         return "This eBook is empty – no audio.", 400
 
-    filename = f"book_{book_id}.mp3"
-    tmp = os.path.join(tempfile.gettempdir(), filename)
+    filename = f"{audio_cache_key(text)}.mp3"
+    if audio_cache.has(filename):
+        log.info("Audio cache hit: book %s", book_id)
+        return render_template(
+            "audio_player.html", audio_url=cached_audio_url(filename, book_id), title=title
+        )
 
-    try:
-        synthesize(text, tmp)
-    except Exception as e:
-        app.logger.error(f"TTS failed: {e}")
-        return f"TTS error: {e}", 500
+    job_id = job_queue.enqueue("audio", {"book_id": book_id}, dedupe_key=f"audio:{filename}")
+    return render_template(
+        "audio_player.html",
+        audio_url=None,
+        title=title,
+        job_url=url_for("main.job_status", job_id=job_id),
+        stream_url=url_for("main.audio_stream", book_id=book_id)
+    )
 
-    if USE_GCS:
-        url = upload_to_gcs(tmp, filename)
-    else:
-        local_dir = os.path.join(app.root_path, "static", "audio")
-        os.makedirs(local_dir, exist_ok=True)
-        dst = os.path.join(local_dir, filename)
-        if not os.path.exists(dst):
-            shutil.copy(tmp, dst)
-        url = url_for("static", filename=f"audio/{filename}")
 
-    return render_template("audio_player.html", audio_url=url, title=title)
+@bp.route("/audio/<int:book_id>/stream")
+def audio_stream(book_id):
+    """
+    Streams MP3 frames while chunks are still rendering. The audio job does
+    the rendering and caching; this follows its output.
+    """
+    row = fetch_book(book_id)
+    if not row:
+        abort(404)
+    title, text = row
+    if not text.strip():
+        return "This eBook is empty – no audio.", 400
+
+    filename = f"{audio_cache_key(text)}.mp3"
+    if audio_cache.has(filename):
+        return redirect(cached_audio_url(filename, book_id))
+
+    # Share the render with the player page: same job, same partial file
+    job_id = job_queue.enqueue("audio", {"book_id": book_id}, dedupe_key=f"audio:{filename}")
+    return Response(
+        stream_with_context(tail_render(filename, job_id)),
+        mimetype="audio/mpeg",
+        headers={"Cache-Control": "no-store"}
+    )
+
+
+@bp.route("/audio_file/<filename>")
+def audio_file(filename):
+    """
+    Serves a cached MP3 from the local audio cache tier.
+    """
+    return send_from_directory(audio_cache.directory, filename, mimetype="audio/mpeg")
+
 
+@bp.route("/assets/<path:filename>")
+def asset(filename):
+    """
+    Fingerprinted build output from `python assets.py`. A name only ever has one
+    content, so it is cacheable for a year; clients that accept br / gzip get
+    the precompressed copy.
+    """
+    path, encoding = filename, None
+    for enc in asset_manifest.encodings(filename):
+        if request.accept_encodings.quality(enc) > 0:
+            path, encoding = filename + ENCODINGS[enc], enc
+            break
+    resp = send_from_directory(
+        asset_manifest.build_dir, path,
+        mimetype=mimetypes.guess_type(filename)[0], max_age=ASSET_MAX_AGE
+    )
+    if encoding:
+        resp.content_encoding = encoding
+    resp.vary.add("Accept-Encoding")
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
 
-@app.route("/download_text/<int:book_id>")
+
+@bp.route("/download_text/<int:book_id>")
 def download_text(book_id):
     """
     Download .txt version of a book from the database.
+    Small books come from the row cache, large ones are streamed in chunks.
+    Supports conditional GET and single byte Range requests.
     """
-    row = fetch_one("SELECT title, content FROM books WHERE book_id = %s", book_id)
-    if not row:
+    meta = fetch_book_meta(book_id)
+    if not meta:
         abort(404)
-    title, content = row
+    title, updated_at, size = meta
+    etag = content_etag(book_id, updated_at, size)
     safe = "".join(c for c in title if c.isalnum() or c in (" ", "_")).strip().replace(" ", "_")
-    resp = make_response(content)
-    resp.headers.update({
-        "Content-Disposition": f'attachment; filename="{safe}.txt"',
-        "Content-Type": "text/plain"
-    })
+
+    if not_modified(etag, updated_at):
+        resp = Response(status=304)
+    else:
+        byte_range = requested_range(size, etag, updated_at)
+        start, stop = byte_range or (0, size)
+        if size <= current_app.config["CACHE_MAX_ITEM_BYTES"]:
+            body = [(fetch_book(book_id)[1] or "").encode("utf-8")[start:stop]]
+        else:
+            body = stream_with_context(iter_book_bytes(book_id, updated_at, start, stop))
+        resp = Response(body, status=206 if byte_range else 200, mimetype="text/plain")
+        resp.content_length = stop - start
+        if byte_range:
+            resp.content_range = ContentRange("bytes", start, stop, size)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{safe}.txt"'
+    resp.accept_ranges = "bytes"
+    resp.set_etag(etag)
+    resp.last_modified = updated_at
     return resp
 
 
-@app.route("/generate", methods=["POST"])
+@bp.route("/generate", methods=["POST"])
 def generate():
     """
-    Handles AI story generation using Gemini.
-    Saves new eBook to the database.
+    Queues AI story generation using Gemini.
+    Returns the job id at once; the worker saves the new eBook to the database.
     """
     theme = request.form.get("theme", "").strip()
     if not theme:
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
 
-    try:
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        story = model.generate_content(
-            f"Write a creative short story (~500 words) titled '{theme}'."
-        ).text.strip()
+    job_id = job_queue.enqueue("generate", {"theme": theme})
+    if wants_json():
+        return jsonify(job_id=job_id, status_url=url_for("main.job_status", job_id=job_id)), 202
+    return redirect(url_for("main.index"))
 
-        with db_cursor() as cur:
-            cur.execute("SELECT author_id FROM authors WHERE name=%s", ("Gemini AI",))
-            r = cur.fetchone()
-            if r:
-                aid = r[0]
-            else:
-                cur.execute(
-                    "INSERT INTO authors(name) VALUES(%s) RETURNING author_id",
-                    ("Gemini AI",)
-                )
-                aid = cur.fetchone()[0]
 
-            cur.execute(
-                "INSERT INTO books(title,content,genre,published_date,author_id) "
-                "VALUES(%s,%s,%s,CURRENT_DATE,%s)",
-                (theme, story, "Fiction", aid)
-            )
-        app.logger.info("New story saved: %s", theme)
+@bp.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    """
+    Job status as JSON, with links to the finished book or audio when done.
+    """
+    job = job_queue.get(job_id)
+    if not job:
+        abort(404)
+    result = job["result"] or {}
+    if job["status"] == "done":
+        if job["kind"] == "generate":
+            result["read_url"] = url_for("main.read", book_id=result["book_id"])
+        elif job["kind"] == "audio":
+            result["audio_url"] = cached_audio_url(result["filename"], result["book_id"])
+    return jsonify(
+        job_id=job["job_id"],
+        kind=job["kind"],
+        status=job["status"],
+        progress=job["progress"],
+        attempts=job["attempts"],
+        result=result,
+        error=job["error"]
+    )
+
+
+@bp.route("/cache/stats")
+def cache_stats():
+    """
+    Page / row cache hit and miss counters, for sizing CACHE_MAX_MB and CACHE_TTL.
+    """
+    return jsonify(page_cache.stats())
 
-    except Exception:
-        app.logger.exception("AI generation failed")
 
-    return redirect(url_for("index"))
+@bp.route("/metrics")
+def metrics():
+    """
+    Prometheus-style metrics: route and dependency latency histograms, queries
+    per request, payload sizes, database pool wait time and page cache counters.
+    """
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
-@app.route("/submit_review/<int:book_id>", methods=["POST"])
+@bp.route("/submit_review/<int:book_id>", methods=["POST"])
 def submit_review(book_id):
     """
     Submit a review for a book, using DB for users & reviews.
@@ -273,8 +1135,104 @@ def submit_review(book_id):
             "VALUES(%s,%s,%s,%s,CURRENT_DATE)",
             (uid, book_id, rating, text)
         )
+        # Same transaction as the review, so the aggregate never drifts
+        cur.execute(
+            "INSERT INTO book_ratings(book_id,rating_sum,rating_count,last_review_date) "
+            "VALUES(%s,%s,1,CURRENT_DATE) "
+            "ON CONFLICT (book_id) DO UPDATE SET "
+            "rating_sum = book_ratings.rating_sum + EXCLUDED.rating_sum, "
+            "rating_count = book_ratings.rating_count + 1, "
+            "last_review_date = GREATEST(book_ratings.last_review_date, EXCLUDED.last_review_date)",
+            (book_id, rating)
+        )
+    invalidate_listing()
     return jsonify(success=True)
 
 
+@bp.cli.command("init-db")
+def init_db():
+    """Creates or upgrades the database schema from schema.sql."""
+    with open(os.path.join(ROOT, "schema.sql"), encoding="utf-8") as f:
+        sql = f.read()
+    with db_cursor() as cur:
+        cur.execute(sql)
+    print("Database schema is up to date.")
+
+
+@bp.cli.command("rebuild-ratings")
+def rebuild_ratings():
+    """Recomputes book_ratings from the reviews table (backfill / repair)."""
+    with db_cursor() as cur:
+        # Blocks concurrent submit_review() upserts until the rebuild commits
+        cur.execute("LOCK TABLE book_ratings IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute("DELETE FROM book_ratings")
+        cur.execute("""
+            INSERT INTO book_ratings(book_id, rating_sum, rating_count, last_review_date)
+            SELECT book_id, SUM(rating), COUNT(rating), MAX(review_date)
+              FROM reviews
+             WHERE rating IS NOT NULL
+          GROUP BY book_id
+        """)
+        count = cur.rowcount
+    invalidate_listing()
+    print(f"Rebuilt rating aggregates for {count} books.")
+
+
+@bp.cli.command("update-book")
+@click.argument("book_id", type=int)
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def update_book(book_id, path):
+    """Replaces a book's content with the text in PATH and invalidates its caches."""
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    with db_cursor() as cur:
+        cur.execute("UPDATE books SET content = %s WHERE book_id = %s", (content, book_id))
+        updated = cur.rowcount
+    if not updated:
+        raise click.ClickException(f"Book {book_id} not found")
+    invalidate_book(book_id)
+    print(f"Updated book {book_id} ({len(content.encode('utf-8'))} bytes).")
+
+
+def create_app(config=None, db_pool=None, tts_client=None, bucket=None, gemini_model=None):
+    """
+    Builds a Flask app with its own database pool, caches and job queue, set
+    up from `config` over the environment defaults above. Cheap to call:
+    nothing connects until a request first needs it. `db_pool`, `tts_client`,
+    `bucket` and `gemini_model` replace the real clients, e.g. with test stubs.
+    """
+    app = Flask(__name__)
+    app.logger.setLevel(logging.INFO)
+    app.config.from_mapping(
+        DATABASE_URL=DATABASE_URL,
+        DB_POOL_MIN=DB_POOL_MIN,
+        DB_POOL_MAX=DB_POOL_MAX,
+        DB_POOL_TIMEOUT=DB_POOL_TIMEOUT,
+        DB_POOL_MAX_LIFETIME=DB_POOL_MAX_LIFETIME,
+        CACHE_URL=CACHE_URL,
+        CACHE_MAX_BYTES=CACHE_MAX_BYTES,
+        CACHE_TTL=CACHE_TTL,
+        CACHE_MAX_ITEM_BYTES=CACHE_MAX_ITEM_BYTES,
+        AUDIO_CACHE_DIR=AUDIO_CACHE_DIR or os.path.join(ROOT, "static", "audio"),
+        AUDIO_CACHE_MAX_BYTES=AUDIO_CACHE_MAX_BYTES,
+        JOB_WORKERS=JOB_WORKERS,
+        USE_GCS=USE_GCS,
+        GCS_BUCKET=GCS_BUCKET
+    )
+    app.config.update(config or {})
+    app.extensions["ebooks"] = Services(app, db_pool, tts_client, bucket, gemini_model)
+    app.register_blueprint(bp)
+    app.wsgi_app = traced(app.wsgi_app, app)
+    return app
+
+
+default_app = once(create_app)
+
+def __getattr__(name):
+    # `app` for `gunicorn app:app` and `flask --app app`, built on first access, not on import
+    if name == "app":
+        return default_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
-    app.run(debug=not USE_GCS)
+    default_app().run(debug=not USE_GCS)
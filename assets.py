@@ -0,0 +1,287 @@
+#assets.py
+#===============================================
+#    Static asset build and manifest
+#    Purpose: Fingerprinted, precompressed static files that browsers cache for good
+#    Notes:
+#    - build() copies static/ into static/dist/ under content-hashed names
+#      (styles.3f9c2a1b7d.css): a built URL never changes meaning, so it can be
+#      served with a one-year immutable Cache-Control; editing a file renames it
+#    - Text assets get .gz and, with the optional `brotli` package, .br siblings;
+#      the app picks one per Accept-Encoding instead of compressing per request
+#    - Images are resized to --image-width and re-encoded as their own format
+#      plus AVIF / WebP when Pillow is installed; otherwise they are copied as-is
+#    - url() references in CSS point at the built names, and declarations using
+#      an image with modern variants are repeated with image-set(), so browsers
+#      that support it download the smaller format
+#    - manifest.json is written last. Files from older builds are kept (unless
+#      --clean), so cached pages that still link to them keep working
+#    Usage:
+#        python assets.py
+#        python assets.py --image-width 1280 --clean
+#===============================================
+
+import io
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+import importlib
+import mimetypes
+import posixpath
+
+log = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(ROOT, "static")
+BUILD_DIR = os.path.join(SOURCE_DIR, "dist")
+MANIFEST = "manifest.json"
+SKIP_DIRS = {"audio"}  # runtime audio cache, not a shipped asset
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+COMPRESSIBLE = {".css", ".js", ".mjs", ".svg", ".json", ".txt", ".html", ".xml", ".ico"}
+IMAGE_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".webp": "WEBP"}
+# (extension, Pillow format, save options), tried for every image
+MODERN_FORMATS = (
+    (".avif", "AVIF", {"quality": 55}),
+    (".webp", "WEBP", {"quality": 72, "method": 6}),
+)
+SAVE_OPTIONS = {
+    "JPEG": {"quality": 80, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 72, "method": 6},
+}
+
+CSS_DECLARATION = re.compile(r"[^;{}]*url\([^;{}]*")
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+?)\1\s*\)""")
+
+
+def optional_import(name):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def write_file(path, data):
+    """Atomic write, so the app never serves a half-written file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_hashed(name, data, out_dir):
+    """
+    Writes `data` as <stem>.<content hash><ext> under out_dir and returns that
+    name. Unchanged content maps to the same name and is not rewritten.
+    """
+    stem, ext = posixpath.splitext(name)
+    built = f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+    path = os.path.join(out_dir, built)
+    if not os.path.exists(path):
+        write_file(path, data)
+    return built
+
+
+def write_compressed(built, data, out_dir, brotli):
+    """Precompressed siblings of a built file; returns the encodings kept."""
+    candidates = {"gzip": lambda: gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        candidates["br"] = lambda: brotli.compress(data, quality=11)
+    kept = []
+    for encoding, suffix in ENCODINGS.items():
+        if encoding in candidates:
+            packed = candidates[encoding]()
+            if len(packed) < len(data):
+                write_file(os.path.join(out_dir, built + suffix), packed)
+                kept.append(encoding)
+    return kept
+
+
+def encode_image(data, ext, max_width, Image):
+    """
+    Resizes an image to at most `max_width` pixels wide and re-encodes it.
+    Returns (fallback bytes in the file's own format, [(ext, bytes), ...] for
+    each modern format that came out smaller than the fallback).
+    """
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    if img.width > max_width:
+        img = img.resize((max_width, round(img.height * max_width / img.width)), Image.LANCZOS)
+
+    fmt = IMAGE_FORMATS[ext]
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    out = io.BytesIO()
+    img.save(out, fmt, **SAVE_OPTIONS[fmt])
+    fallback = out.getvalue()
+
+    variants = []
+    for variant_ext, variant_fmt, options in MODERN_FORMATS:
+        if variant_fmt == fmt or variant_fmt not in Image.SAVE:
+            continue
+        out = io.BytesIO()
+        img.save(out, variant_fmt, **options)
+        if out.tell() < len(fallback):
+            variants.append((variant_ext, out.getvalue()))
+    return fallback, variants
+
+
+def rewrite_css(name, css, manifest):
+    """
+    Points url() references at built files, relative to the built stylesheet.
+    A declaration whose image has modern variants is followed by a copy using
+    image-set(); browsers that cannot parse it keep the plain declaration.
+    """
+    base = posixpath.dirname(name)
+
+    def lookup(ref):
+        if ref.startswith("/static/"):
+            return manifest.get(ref[len("/static/"):])
+        if ref.startswith(("/", "#", "data:")) or "://" in ref:
+            return None
+        return manifest.get(posixpath.normpath(posixpath.join(base, ref)))
+
+    def link(built):
+        return posixpath.relpath(built, base or ".")
+
+    def replace(match, modern):
+        entry = lookup(match.group(2))
+        if entry is None:
+            return match.group(0)
+        if not (modern and entry.get("variants")):
+            return f'url("{link(entry["file"])}")'
+        options = entry["variants"] + [{"file": entry["file"], "type": entry["type"]}]
+        return "image-set(" + ", ".join(
+            f'url("{link(o["file"])}") type("{o["type"]}")' for o in options
+        ) + ")"
+
+    def declaration(match):
+        plain = CSS_URL.sub(lambda m: replace(m, False), match.group(0))
+        modern = CSS_URL.sub(lambda m: replace(m, True), match.group(0))
+        return plain if modern == plain else f"{plain};{modern}"
+
+    return CSS_DECLARATION.sub(declaration, css)
+
+
+def iter_sources(source_dir, out_dir):
+    """Relative, '/'-separated names of the files to build."""
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        rel = os.path.relpath(dirpath, source_dir)
+        dirnames[:] = sorted(
+            d for d in dirnames
+            if not d.startswith(".")
+            and os.path.join(dirpath, d) != out_dir
+            and not (rel == "." and d in SKIP_DIRS)
+        )
+        for filename in filenames:
+            if not filename.startswith("."):
+                yield posixpath.normpath(posixpath.join(rel.replace(os.sep, "/"), filename))
+
+
+def build(source_dir=SOURCE_DIR, out_dir=BUILD_DIR, image_width=1600, clean=False):
+    """
+    Builds every file under source_dir into out_dir and writes manifest.json.
+    Returns the manifest: source name -> {"file", "type", "encodings", "variants"}.
+    """
+    out_dir = os.path.abspath(out_dir)
+    brotli = optional_import("brotli")
+    Image = optional_import("PIL.Image")
+    if brotli is None:
+        log.warning("brotli is not installed; only gzip variants will be built")
+    if Image is None:
+        log.warning("Pillow is not installed; images are copied without resizing or modern formats")
+    if clean:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    manifest = {}
+    # Stylesheets last: they are rewritten to point at the other built files
+    for name in sorted(iter_sources(source_dir, out_dir), key=lambda n: (n.endswith(".css"), n)):
+        with open(os.path.join(source_dir, name), "rb") as f:
+            data = f.read()
+        stem, ext = posixpath.splitext(name)
+        ext = ext.lower()
+        entry = {"type": mimetypes.guess_type(name)[0] or "application/octet-stream"}
+
+        if ext == ".css":
+            data = rewrite_css(name, data.decode("utf-8"), manifest).encode("utf-8")
+        elif ext in IMAGE_FORMATS and Image is not None:
+            data, variants = encode_image(data, ext, image_width, Image)
+            entry["variants"] = [
+                {"file": write_hashed(stem + variant_ext, blob, out_dir),
+                 "type": mimetypes.guess_type(name + variant_ext)[0] or "image/" + variant_ext[1:]}
+                for variant_ext, blob in variants
+            ]
+        entry["file"] = write_hashed(name, data, out_dir)
+        if ext in COMPRESSIBLE:
+            entry["encodings"] = write_compressed(entry["file"], data, out_dir, brotli)
+        manifest[name] = entry
+        log.info("%s -> %s (%d bytes%s)", name, entry["file"], len(data), "".join(
+            f", {v['type']} {os.path.getsize(os.path.join(out_dir, v['file']))}"
+            for v in entry.get("variants", ())
+        ))
+
+    write_file(os.path.join(out_dir, MANIFEST),
+               json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+class Manifest:
+    """
+    Read side of the build for the app: source name -> built file. Picks up a
+    new manifest.json when the file changes, so rebuilding needs no restart.
+    Empty when nothing has been built, and callers fall back to /static/.
+    """
+
+    def __init__(self, build_dir=BUILD_DIR):
+        self.build_dir = build_dir
+        self.path = os.path.join(build_dir, MANIFEST)
+        self._state = (None, {}, {})  # (mtime_ns, entries, built file -> encodings)
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        state = self._state
+        if mtime != state[0]:
+            entries = {}
+            if mtime is not None:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        entries = json.load(f)
+                except (OSError, ValueError):
+                    log.warning("Unreadable asset manifest %s", self.path, exc_info=True)
+            files = {e["file"]: e.get("encodings", []) for e in entries.values()}
+            state = self._state = (mtime, entries, files)
+        return state
+
+    def get(self, name):
+        return self._load()[1].get(name)
+
+    def encodings(self, built):
+        """Precompressed encodings available for a built file, best first."""
+        return self._load()[2].get(built, ())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint, compress and optimize static assets.")
+    parser.add_argument("--source", default=SOURCE_DIR, help="static files to build (default: static/)")
+    parser.add_argument("--out", default=BUILD_DIR, help="build directory (default: static/dist/)")
+    parser.add_argument("--image-width", type=int, default=1600, help="max width of built images")
+    parser.add_argument("--clean", action="store_true", help="remove earlier builds first")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    manifest = build(args.source, args.out, args.image_width, args.clean)
+    log.info("Built %d assets into %s", len(manifest), args.out)
+
+
+if __name__ == "__main__":
+    main()
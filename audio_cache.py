@@ -0,0 +1,168 @@
+#audio_cache.py
+#===============================================
+#    Content-addressed cache for synthesized audio
+#    Purpose: Keeps rendered MP3s keyed by a hash of (content, voice, encoding)
+#    Notes:
+#    - Local disk tier is size bounded, least recently used files are evicted first
+#    - Optional object store tier uses the same GCS bucket as the rest of the app
+#    - Edited content hashes to a new key, so stale audio is never served
+#    - Bucket calls are timed as gcs.exists / gcs.download / gcs.upload in /metrics
+#===============================================
+
+import os
+import hashlib
+import shutil
+import tempfile
+import threading
+import logging
+
+from metrics import span
+
+log = logging.getLogger(__name__)
+
+
+def cache_key(text, voice, encoding):
+    """
+    Returns a stable hex digest for the given content and synthesis settings.
+    """
+    h = hashlib.sha256()
+    for part in (voice, encoding, text):
+        data = str(part).encode("utf-8")
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class AudioCache:
+    """
+    Two tier audio cache: local directory (LRU by mtime) plus an optional bucket.
+    `bucket` may also be a zero-argument callable returning the bucket, so the
+    storage client is only built the first time the remote tier is needed.
+    """
+
+    def __init__(self, directory, max_bytes, bucket=None, prefix="audio/"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bucket = bucket
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def bucket(self):
+        if callable(self._bucket):
+            self._bucket = self._bucket()
+        return self._bucket
+
+    def local_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def partial_path(self, name):
+        """
+        Where a render in progress writes `name`. Hidden, so eviction skips it;
+        readers can tail it until put() moves the finished file into the cache.
+        """
+        return os.path.join(self.directory, f".{name}.rendering")
+
+    def blob_name(self, name):
+        return f"{self.prefix}{name}"
+
+    def has(self, name):
+        """
+        True when `name` is cached locally or in the bucket. Nothing is
+        downloaded: for callers that only hand out a URL or skip a render.
+        """
+        if self._touch(self.local_path(name)):
+            return True
+        if self.bucket is None:
+            return False
+        with span("gcs", "exists"):
+            return self.bucket.blob(self.blob_name(name)).exists()
+
+    def get(self, name):
+        """
+        Returns the local path of a cached file, or None on a miss.
+        A remote hit is pulled down into the local tier first.
+        """
+        path = self.local_path(name)
+        if self._touch(path):
+            return path
+
+        if self.bucket is None:
+            return None
+        blob = self.bucket.blob(self.blob_name(name))
+        with span("gcs", "exists"):
+            found = blob.exists()
+        if not found:
+            return None
+        tmp = self._tmp_path()
+        try:
+            with span("gcs", "download") as s:
+                blob.download_to_filename(tmp)
+                s.bytes = os.path.getsize(tmp)
+            self._store(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        log.info("Audio cache remote hit: %s", name)
+        return path
+
+    def put(self, name, src_path, upload=True):
+        """
+        Moves a freshly rendered file into the cache and (optionally) the bucket.
+        Returns the local cached path.
+        """
+        path = self.local_path(name)
+        if self.bucket is not None and upload:
+            with span("gcs", "upload") as s:
+                s.bytes = os.path.getsize(src_path)
+                self.bucket.blob(self.blob_name(name)).upload_from_filename(src_path)
+        self._store(src_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """
+        Removes least recently used files until the directory fits in max_bytes.
+        """
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.is_file() or entry.name.startswith("."):
+                    continue
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+
+    def _touch(self, path):
+        """Bumps a local file's recency for LRU eviction; False if it is not there."""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _tmp_path(self):
+        fd, tmp = tempfile.mkstemp(prefix=".", suffix=".part", dir=self.directory)
+        os.close(fd)
+        return tmp
+
+    def _store(self, src_path, dst_path):
+        # Copy to a hidden temp name, then atomically rename into place
+        tmp = self._tmp_path()
+        try:
+            shutil.copyfile(src_path, tmp)
+            os.replace(tmp, dst_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
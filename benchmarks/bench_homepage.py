@@ -0,0 +1,98 @@
+#benchmarks/bench_homepage.py
+#===============================================
+#    Homepage query benchmark: GROUP BY over reviews vs. book_ratings aggregate
+#    Usage:
+#        python benchmarks/bench_homepage.py --books 10000 --reviews 1000000
+#===============================================
+
+import time
+
+from common import arg_parser, connect, bench_schema, timed, report
+
+# The homepage query before book_ratings existed
+BEFORE_SQL = """
+    SELECT b.book_id, b.title, a.name, b.genre, b.published_date,
+           AVG(r.rating) AS avg_rating, COUNT(r.review_id) AS total_reviews
+      FROM books b
+      JOIN authors a USING (author_id)
+      LEFT JOIN reviews r USING (book_id)
+  GROUP BY b.book_id, b.title, a.name, b.genre, b.published_date
+  ORDER BY b.published_date DESC
+"""
+
+# The homepage query reading the maintained aggregate (app.index)
+AFTER_SQL = """
+    SELECT b.book_id, b.title, a.name, b.genre, b.published_date,
+           br.rating_sum::numeric / NULLIF(br.rating_count, 0) AS avg_rating,
+           COALESCE(br.rating_count, 0) AS total_reviews
+      FROM books b
+      JOIN authors a USING (author_id)
+      LEFT JOIN book_ratings br USING (book_id)
+  ORDER BY b.published_date DESC
+"""
+
+
+def populate(cur, books, reviews):
+    cur.execute("INSERT INTO authors(name) SELECT 'Author ' || g FROM generate_series(1, 500) g")
+    cur.execute(
+        "INSERT INTO users(username, email) "
+        "SELECT 'user' || g, 'user' || g || '@example.com' FROM generate_series(1, 5000) g"
+    )
+    cur.execute(
+        "INSERT INTO books(title, author_id, genre, published_date, content) "
+        "SELECT 'Book ' || g, 1 + g %% 500, 'Fiction', DATE '2020-01-01' + g %% 1500, 'Story text.' "
+        "FROM generate_series(1, %s) g",
+        (books,)
+    )
+    cur.execute(
+        "INSERT INTO reviews(user_id, book_id, rating, review_text, review_date) "
+        "SELECT 1 + g %% 5000, 1 + (g::bigint * 7919) %% %s, 1 + g %% 5, 'Review text.', "
+        "       DATE '2020-01-01' + g %% 1500 "
+        "FROM generate_series(1, %s) g",
+        (books, reviews)
+    )
+
+
+def rebuild(cur):
+    # Same statement as `flask rebuild-ratings`
+    cur.execute("""
+        INSERT INTO book_ratings(book_id, rating_sum, rating_count, last_review_date)
+        SELECT book_id, SUM(rating), COUNT(rating), MAX(review_date)
+          FROM reviews
+         WHERE rating IS NOT NULL
+      GROUP BY book_id
+    """)
+
+
+def main():
+    parser = arg_parser("Homepage query benchmark")
+    parser.add_argument("--books", type=int, default=10_000)
+    parser.add_argument("--reviews", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    conn = connect(args.dsn)
+    with bench_schema(conn, "bench_homepage", keep=args.keep):
+        with conn.cursor() as cur:
+            start = time.perf_counter()
+            populate(cur, args.books, args.reviews)
+            conn.commit()
+            print(f"Loaded {args.books:,} books / {args.reviews:,} reviews "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+            start = time.perf_counter()
+            rebuild(cur)
+            conn.commit()
+            print(f"rebuild-ratings backfill took {time.perf_counter() - start:.2f}s")
+            cur.execute("ANALYZE")
+            conn.commit()
+
+            def run(sql):
+                return lambda: (cur.execute(sql), cur.fetchall())
+
+            before = report("before: GROUP BY over reviews", timed(run(BEFORE_SQL), args.repeat))
+            after = report("after: book_ratings aggregate", timed(run(AFTER_SQL), args.repeat))
+            print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
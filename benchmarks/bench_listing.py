@@ -0,0 +1,60 @@
+#benchmarks/bench_listing.py
+#===============================================
+#    Library listing benchmark: keyset page latency at growing catalog sizes
+#    Usage:
+#        python benchmarks/bench_listing.py --sizes 100 10000 1000000
+#===============================================
+
+from common import arg_parser, connect, bench_schema, timed, report
+from bench_homepage import populate, rebuild
+
+# Same statement as app.fetch_books_page()
+PAGE_SQL = """
+    SELECT b.book_id, b.title, a.name, b.genre, b.published_date,
+           br.rating_sum::numeric / NULLIF(br.rating_count, 0) AS avg_rating,
+           COALESCE(br.rating_count, 0) AS total_reviews
+      FROM books b
+      JOIN authors a USING (author_id)
+      LEFT JOIN book_ratings br USING (book_id)
+     WHERE (COALESCE(b.published_date, '-infinity'::date), b.book_id) < (%s::date, %s)
+  ORDER BY COALESCE(b.published_date, '-infinity'::date) DESC, b.book_id DESC
+     LIMIT %s
+"""
+
+
+def main():
+    parser = arg_parser("Keyset listing benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 1_000_000])
+    parser.add_argument("--page-size", type=int, default=24)
+    args = parser.parse_args()
+
+    conn = connect(args.dsn)
+    for size in args.sizes:
+        with bench_schema(conn, "bench_listing", keep=args.keep):
+            with conn.cursor() as cur:
+                populate(cur, size, size)
+                rebuild(cur)
+                cur.execute("ANALYZE")
+                conn.commit()
+
+                # Cursors at the start, middle and end of the catalog
+                cur.execute(
+                    "SELECT COALESCE(published_date, '-infinity'::date)::text, book_id FROM books "
+                    "ORDER BY COALESCE(published_date, '-infinity'::date) DESC, book_id DESC"
+                )
+                keys = cur.fetchall()
+                cursors = {
+                    "first": ("infinity", 0),
+                    "middle": keys[len(keys) // 2],
+                    "last": keys[max(0, len(keys) - args.page_size - 1)],
+                }
+                print(f"-- {size:,} books")
+                for label, key in cursors.items():
+                    def run(key=key):
+                        cur.execute(PAGE_SQL, (*key, args.page_size + 1))
+                        cur.fetchall()
+                    report(f"   {label} page", timed(run, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#benchmarks/bench_pool.py
+#===============================================
+#    Connection pool load test: throughput vs worker threads
+#    Notes:
+#    - Each worker thread checks a connection out, runs one query that holds it
+#      for --query-ms (pg_sleep stands in for real query time) and returns it
+#    - Throughput should grow with threads until they outnumber --pool-max;
+#      past that extra threads wait for a connection instead of failing
+#    - --compare runs the same load on psycopg2's ThreadedConnectionPool,
+#      which raises PoolError as soon as it is exhausted
+#    Usage:
+#        python benchmarks/bench_pool.py --threads 1 2 4 8 16 32 --pool-max 8
+#===============================================
+
+import sys
+import time
+import threading
+import statistics
+
+import psycopg2.pool
+
+from common import ROOT, arg_parser
+
+sys.path.insert(0, ROOT)
+from db_pool import ConnectionPool, PoolTimeout  # noqa: E402
+
+
+def worker(pool, query_ms, stop, results):
+    waits, ops, errors = [], 0, 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            conn = pool.getconn()
+        except (PoolTimeout, psycopg2.pool.PoolError):
+            errors += 1
+            time.sleep(query_ms / 1000)  # a real client would back off too
+            continue
+        waits.append(time.perf_counter() - start)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_sleep(%s)", (query_ms / 1000,))
+            conn.commit()
+            ops += 1
+        finally:
+            pool.putconn(conn)
+    results.append((ops, errors, waits))
+
+
+def run(pool, threads, seconds, query_ms):
+    stop = threading.Event()
+    results = []
+    workers = [threading.Thread(target=worker, args=(pool, query_ms, stop, results))
+               for _ in range(threads)]
+    for t in workers:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in workers:
+        t.join()
+    ops = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    waits = sorted(w for r in results for w in r[2]) or [0.0]
+    p99 = waits[min(len(waits) - 1, int(len(waits) * 0.99))]
+    return ops / seconds, errors, statistics.median(waits) * 1000, p99 * 1000
+
+
+def main():
+    parser = arg_parser("Connection pool load test")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--pool-max", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0, help="run time per thread count")
+    parser.add_argument("--query-ms", type=float, default=5.0, help="time each query holds a connection")
+    parser.add_argument("--compare", action="store_true",
+                        help="also run psycopg2's ThreadedConnectionPool")
+    args = parser.parse_args()
+
+    dsn = args.dsn
+    if dsn.startswith("postgres://"):
+        dsn = dsn.replace("postgres://", "postgresql://", 1)
+    if not dsn:
+        raise SystemExit("Set DATABASE_URL or pass --dsn.")
+
+    pools = [("ConnectionPool", lambda: ConnectionPool(dsn, 1, args.pool_max, timeout=30))]
+    if args.compare:
+        pools.append(("ThreadedConnectionPool",
+                      lambda: psycopg2.pool.ThreadedConnectionPool(1, args.pool_max, dsn=dsn)))
+
+    ideal = args.pool_max * 1000 / args.query_ms
+    print(f"pool max {args.pool_max}, {args.query_ms:g} ms per query "
+          f"(ceiling ~{ideal:,.0f} ops/s)")
+    for name, make in pools:
+        print(f"\n{name}")
+        for threads in args.threads:
+            pool = make()
+            try:
+                rate, errors, p50, p99 = run(pool, threads, args.seconds, args.query_ms)
+            finally:
+                pool.closeall()
+            print(f"  {threads:>3} threads {rate:9,.0f} ops/s   wait p50 {p50:7.2f} ms   "
+                  f"p99 {p99:7.2f} ms   pool errors {errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#benchmarks/bench_search.py
+#===============================================
+#    Full-text search benchmark on a synthetic catalog
+#    Usage:
+#        python benchmarks/bench_search.py --books 100000
+#===============================================
+
+import io
+import time
+
+from common import arg_parser, connect, bench_schema, timed, report
+from corpus import synthetic_books, tsv_escape
+
+# Same statement as app.search_books()
+SEARCH_SQL = """
+    WITH q AS NOT MATERIALIZED (SELECT websearch_to_tsquery('english', %s) AS query),
+    title_hits AS (
+        SELECT b.book_id, 1 + ts_rank_cd(b.title_vector, q.query, 32) AS rank
+          FROM books b, q
+         WHERE b.title_vector @@ q.query
+      ORDER BY rank DESC, b.book_id DESC
+         LIMIT %s
+    ),
+    text_hits AS (
+        SELECT b.book_id, ts_rank_cd(b.search_vector, q.query, 32) AS rank
+          FROM books b, q
+         WHERE b.search_vector @@ q.query
+      ORDER BY b.book_id DESC
+         LIMIT %s
+    ),
+    hits AS (
+        SELECT book_id, max(rank)::real AS rank
+          FROM (SELECT * FROM title_hits UNION ALL SELECT * FROM text_hits) c
+      GROUP BY book_id
+    )
+    SELECT b.book_id, b.title, a.name, b.genre, b.published_date, page.rank,
+           ts_headline('english', b.content, q.query,
+                       'StartSel=' || chr(1) || ', StopSel=' || chr(2) ||
+                       ', MaxFragments=2, MinWords=8, MaxWords=24, FragmentDelimiter=" … "'),
+           greatest((SELECT count(*) FROM title_hits), (SELECT count(*) FROM text_hits))
+      FROM (SELECT * FROM hits
+          ORDER BY rank DESC, book_id DESC
+             LIMIT %s) page
+      JOIN books b USING (book_id)
+      JOIN authors a USING (author_id)
+     CROSS JOIN q
+  ORDER BY page.rank DESC, b.book_id DESC
+"""
+
+QUERIES = [
+    "pharaoh",
+    "ancient tomb",
+    "\"space marine\"",
+    "robot -jungle",
+    "ork OR underwater",
+]
+
+
+def load(cur, books, batch=10_000):
+    """
+    COPYs the synthetic corpus into books in fixed-size batches.
+    """
+    cur.execute("INSERT INTO authors(name) VALUES ('Benchmark') RETURNING author_id")
+    author_id = cur.fetchone()[0]
+    buf = io.StringIO()
+    rows = 0
+    for title, genre, published, content in synthetic_books(books):
+        buf.write("\t".join(tsv_escape(v) for v in (title, genre, published, content, author_id)))
+        buf.write("\n")
+        rows += 1
+        if rows % batch == 0 or rows == books:
+            buf.seek(0)
+            cur.copy_expert(
+                "COPY books(title, genre, published_date, content, author_id) FROM STDIN", buf
+            )
+            buf = io.StringIO()
+
+
+def main():
+    parser = arg_parser("Full-text search benchmark")
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--page-size", type=int, default=24)
+    parser.add_argument("--target-ms", type=float, default=50.0)
+    parser.add_argument("--max-candidates", type=int, default=1000,
+                        help="same as the app's SEARCH_MAX_CANDIDATES")
+    args = parser.parse_args()
+
+    conn = connect(args.dsn)
+    with bench_schema(conn, "bench_search", keep=args.keep):
+        with conn.cursor() as cur:
+            start = time.perf_counter()
+            load(cur, args.books)
+            cur.execute("ANALYZE books")
+            conn.commit()
+            print(f"Loaded {args.books:,} synthetic books in {time.perf_counter() - start:.1f}s")
+
+            slow = 0
+            for query in QUERIES:
+                cur.execute(
+                    "SELECT count(*) FILTER (WHERE search_vector @@ q), count(*) FILTER (WHERE title_vector @@ q) "
+                    "FROM books, websearch_to_tsquery('english', %s) q",
+                    (query,)
+                )
+                matches, titles = cur.fetchone()
+
+                def run(query=query):
+                    cur.execute(SEARCH_SQL, (query, args.max_candidates, args.max_candidates,
+                                             args.page_size + 1))
+                    cur.fetchall()
+                median = report(f"{query!r} ({matches:,} hits, {titles:,} in titles)", timed(run, args.repeat))
+                slow += median > args.target_ms
+            print(f"{len(QUERIES) - slow}/{len(QUERIES)} queries under {args.target_ms:g} ms median")
+
+
+if __name__ == "__main__":
+    main()
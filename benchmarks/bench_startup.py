@@ -0,0 +1,92 @@
+#benchmarks/bench_startup.py
+#===============================================
+#    Cold start benchmark: `import app` time and first response for `/`
+#    Notes:
+#    - Every sample is a fresh interpreter, like a new gunicorn worker
+#    - --baseline REV measures a git revision side by side (e.g. the eager
+#      version before the app factory); it is extracted with `git archive`
+#    - Needs an initialized database (flask --app app init-db); `/` only reads.
+#      Revisions that build Google clients at import also need credentials
+#    Usage:
+#        python benchmarks/bench_startup.py --repeat 10 --baseline HEAD~1
+#===============================================
+
+import io
+import os
+import sys
+import json
+import time
+import tarfile
+import tempfile
+import subprocess
+
+from common import ROOT, arg_parser, report
+
+PROBE = r"""
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+status = app.app.test_client().get("/").status_code
+done = time.perf_counter()
+print(json.dumps({
+    "import": (imported - start) * 1000,
+    "first_response": (done - imported) * 1000,
+    "status": status,
+}))
+"""
+
+
+def probe(tree, env):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=tree, env=env,
+                         capture_output=True, text=True)
+    wall = (time.perf_counter() - start) * 1000
+    if out.returncode != 0:
+        raise SystemExit(f"Probe failed in {tree}:\n{out.stderr[-2000:]}")
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    if result["status"] != 200:
+        raise SystemExit(f"GET / returned {result['status']} in {tree}")
+    result["import_and_first"] = result["import"] + result["first_response"]
+    result["process"] = wall
+    return result
+
+
+def extract(rev, dest):
+    archive = subprocess.run(["git", "-C", ROOT, "archive", "--format=tar", rev],
+                             capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(dest)
+
+
+def measure(label, tree, env, repeat):
+    probe(tree, env)  # warm the bytecode cache
+    runs = [probe(tree, env) for _ in range(repeat)]
+    print(f"\n{label}")
+    return {
+        key: report(f"  {key.replace('_', ' ')}", [r[key] for r in runs])
+        for key in ("import", "first_response", "import_and_first", "process")
+    }
+
+
+def main():
+    parser = arg_parser("Cold start benchmark")
+    parser.add_argument("--baseline", metavar="REV", help="git revision to compare against")
+    args = parser.parse_args()
+    if not args.dsn:
+        raise SystemExit("Set DATABASE_URL or pass --dsn.")
+
+    env = dict(os.environ, DATABASE_URL=args.dsn, JOB_WORKERS="0")
+    current = measure("working tree", ROOT, env, args.repeat)
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tree:
+            extract(args.baseline, tree)
+            baseline = measure(args.baseline, tree, env, args.repeat)
+        print()
+        for key in current:
+            print(f"{key.replace('_', ' '):<20} {baseline[key]:8.1f} ms -> {current[key]:8.1f} ms "
+                  f"({baseline[key] / current[key]:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
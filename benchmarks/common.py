@@ -0,0 +1,85 @@
+#benchmarks/common.py
+#===============================================
+#    Shared helpers for the benchmark scripts
+#    Notes:
+#    - Every benchmark runs inside its own throwaway Postgres schema, so it can
+#      point at a dev database without touching the real tables
+#    - DSN comes from --dsn or DATABASE_URL (.env is honoured)
+#===============================================
+
+import os
+import time
+import argparse
+import statistics
+from contextlib import contextmanager
+
+import psycopg2
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def arg_parser(description):
+    """
+    Argument parser with the options every benchmark shares.
+    """
+    load_dotenv(os.path.join(ROOT, ".env"))
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL", ""),
+                        help="Postgres connection string (default: $DATABASE_URL)")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per case")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the benchmark schema afterwards")
+    return parser
+
+
+def connect(dsn):
+    if dsn.startswith("postgres://"):
+        dsn = dsn.replace("postgres://", "postgresql://", 1)
+    if not dsn:
+        raise SystemExit("Set DATABASE_URL or pass --dsn.")
+    return psycopg2.connect(dsn)
+
+
+@contextmanager
+def bench_schema(conn, name, keep=False):
+    """
+    Creates schema `name`, loads schema.sql into it and points search_path at it.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {name} CASCADE")
+        cur.execute(f"CREATE SCHEMA {name}")
+        cur.execute(f"SET search_path TO {name}, public")
+        with open(os.path.join(ROOT, "schema.sql"), encoding="utf-8") as f:
+            cur.execute(f.read())
+    conn.commit()
+    try:
+        yield
+    finally:
+        conn.rollback()
+        if not keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {name} CASCADE")
+            conn.commit()
+
+
+def timed(fn, repeat, warmup=2):
+    """
+    Runs `fn` warmup + repeat times; returns the timed durations in milliseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<40} median {statistics.median(samples):9.2f} ms   "
+          f"p95 {p95:9.2f} ms   (n={len(samples)})")
+    return statistics.median(samples)
@@ -0,0 +1,67 @@
+#benchmarks/corpus.py
+#===============================================
+#    Synthetic catalog generator built from the ebooks/*.txt samples
+#    Purpose: Produces any number of realistic-looking books for load and search tests
+#    Notes:
+#    - Each book is a seeded shuffle of real sentences, so word statistics
+#      match the sample stories and runs are reproducible
+#    - Run directly to write a tab-separated dump: title, genre, date, content
+#        python benchmarks/corpus.py --books 100000 > corpus.tsv
+#===============================================
+
+import os
+import re
+import sys
+import random
+import argparse
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIR = os.path.join(ROOT, "ebooks")
+GENRES = ["Fiction", "Science Fiction", "Mystery", "Adventure", "History", "Fantasy"]
+
+
+def load_sentences(directory=SAMPLES_DIR):
+    """
+    Splits every sample book into sentences.
+    """
+    sentences = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".txt"):
+            continue
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            text = " ".join(f.read().split())
+        sentences.extend(s for s in re.split(r"(?<=[.!?])\s+", text) if len(s) > 20)
+    return sentences
+
+
+def synthetic_books(count, seed=587, min_sentences=20, max_sentences=80):
+    """
+    Yields (title, genre, published_date, content) tuples.
+    """
+    rng = random.Random(seed)
+    sentences = load_sentences()
+    words = sorted({w.strip(".,!?;:'\"()").capitalize()
+                    for s in sentences for w in s.split() if len(w) > 4})
+    start = date(2000, 1, 1)
+    for _ in range(count):
+        title = " ".join(rng.sample(words, rng.randint(2, 4)))
+        content = " ".join(rng.choices(sentences, k=rng.randint(min_sentences, max_sentences)))
+        yield title, rng.choice(GENRES), start + timedelta(days=rng.randint(0, 9000)), content
+
+
+def tsv_escape(value):
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic book corpus as TSV")
+    parser.add_argument("--books", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=587)
+    args = parser.parse_args()
+    for row in synthetic_books(args.books, args.seed):
+        sys.stdout.write("\t".join(tsv_escape(v) for v in row) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#cache.py
+#===============================================
+#    Read-through cache for book rows and rendered pages
+#    Purpose: Keeps hot database rows and HTML out of the request path
+#    Notes:
+#    - Local tier: in-process LRU bounded by (approximate) bytes, with TTL
+#    - Optional shared tier (e.g. Redis via CACHE_URL) so processes share fills
+#    - Callers invalidate explicitly when the underlying data changes; TTL
+#      bounds how long another process's local copy can lag behind
+#    - hit / miss counters are kept per tier so the cache can be sized
+#===============================================
+
+import sys
+import time
+import pickle
+import logging
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+def approx_size(value):
+    """
+    Rough in-memory footprint of a cached value, good enough for a byte budget.
+    """
+    if isinstance(value, (str, bytes, bytearray)):
+        return sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(approx_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread-safe LRU with per-entry TTL and a total size budget in bytes.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return MISSING
+            self._data.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, value, ttl=None):
+        size = approx_size(value)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        self._bytes -= self._data.pop(key)[1]
+
+    @property
+    def entries(self):
+        return len(self._data)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+
+class RedisBackend:
+    """
+    Shared cache tier on Redis. Requires the optional `redis` package.
+    """
+
+    def __init__(self, url, prefix="ebooks:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_URL is set but the 'redis' package is not installed") from e
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self._redis.get(self.prefix + key)
+        return MISSING if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        self._redis.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self._redis.delete(*(self.prefix + k for k in keys))
+
+
+def make_shared_backend(url):
+    """
+    Builds the shared tier for a CACHE_URL, or None when no URL is configured.
+    """
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported CACHE_URL scheme: {url}")
+
+
+class ReadThroughCache:
+    """
+    Local LRU in front of an optional shared backend in front of a loader.
+
+    A shared backend only needs get(key) -> value | MISSING, set(key, value, ttl)
+    and delete(*keys). Errors from it are logged and treated as misses, so an
+    outage degrades to hitting the database rather than failing requests.
+    """
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+        self._lock = threading.Lock()
+        self.counters = {
+            "local_hits": 0, "shared_hits": 0, "misses": 0,
+            "invalidations": 0, "shared_errors": 0,
+        }
+
+    def get_or_load(self, key, loader, ttl=None, cacheable=None):
+        """
+        Returns the cached value for `key`, calling `loader()` on a miss.
+        The loaded value is stored only if `cacheable(value)` is true (default:
+        anything but None).
+        """
+        value = self.local.get(key)
+        if value is not MISSING:
+            self._count("local_hits")
+            return value
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception:
+                log.warning("Shared cache get failed for %s", key, exc_info=True)
+                self._count("shared_errors")
+                value = MISSING
+            if value is not MISSING:
+                self._count("shared_hits")
+                self.local.set(key, value, ttl)
+                return value
+
+        self._count("misses")
+        value = loader()
+        if cacheable(value) if cacheable else value is not None:
+            self.local.set(key, value, ttl)
+            if self.shared is not None:
+                try:
+                    self.shared.set(key, value, self.local.ttl if ttl is None else ttl)
+                except Exception:
+                    log.warning("Shared cache set failed for %s", key, exc_info=True)
+                    self._count("shared_errors")
+        return value
+
+    def invalidate(self, *keys):
+        self.local.delete(*keys)
+        self._count("invalidations", len(keys))
+        if self.shared is not None:
+            try:
+                self.shared.delete(*keys)
+            except Exception:
+                log.warning("Shared cache delete failed for %s", keys, exc_info=True)
+                self._count("shared_errors")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats.update(
+            hit_ratio=round((lookups - stats["misses"]) / lookups, 4) if lookups else None,
+            entries=self.local.entries,
+            size_bytes=self.local.size_bytes,
+            max_bytes=self.local.max_bytes,
+            evictions=self.local.evictions,
+            shared_backend=type(self.shared).__name__ if self.shared is not None else None,
+        )
+        return stats
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
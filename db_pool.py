@@ -0,0 +1,235 @@
+#db_pool.py
+#===============================================
+#    Thread-safe, blocking Postgres connection pool
+#    Purpose: Replaces psycopg2's SimpleConnectionPool for threaded workers
+#    Notes:
+#    - getconn() waits up to `timeout` seconds for a free connection instead of
+#      raising at once; PoolTimeout tells the caller to shed load
+#    - Waiters are served first come, first served: a returned connection is
+#      handed to the oldest waiter, so busy threads cannot starve the rest
+#    - Connections idle for longer than `check_idle` are pinged before reuse,
+#      and ones older than `max_lifetime` are replaced when returned
+#    - putconn() rolls back any open or aborted transaction, and drops broken
+#      connections so the next checkout opens a fresh one
+#    - stats() reports size, utilization and wait time for /metrics
+#===============================================
+
+import time
+import logging
+import threading
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+log = logging.getLogger(__name__)
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """No connection became free within the pool timeout."""
+
+
+# Handed to a waiter instead of a connection: "a slot is free, open your own"
+_SLOT = object()
+
+
+class _Waiter:
+    __slots__ = ("event", "handoff")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.handoff = None  # (conn, returned_at) or (_SLOT, None)
+
+
+class ConnectionPool:
+    """
+    Bounded pool of psycopg2 connections, safe to share between threads.
+    Idle connections are reused most-recently-returned first, so surplus
+    connections sit unused long enough to age out.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=10.0,
+                 check_idle=30.0, max_lifetime=3600.0):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("Pool needs 1 <= maxconn and minconn <= maxconn")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_lifetime = max_lifetime
+
+        self._lock = threading.Lock()
+        self._idle = deque()  # (conn, returned_at)
+        self._born = {}  # conn -> created_at, for every open connection
+        self._waiters = deque()
+        self._opening = 0
+        self._closed = False
+        self.counters = {
+            "checkouts": 0, "waits": 0, "wait_seconds": 0.0, "timeouts": 0,
+            "created": 0, "discarded": 0, "rollbacks": 0, "failed_checks": 0,
+        }
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic()))
+
+    # Checkout / return
+    def getconn(self, timeout=None):
+        """
+        Returns a healthy connection, waiting up to `timeout` (default: the
+        pool's) for one to free up. Raises PoolTimeout when none does.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self._closed:
+                raise psycopg2.pool.PoolError("connection pool is closed")
+            self.counters["checkouts"] += 1
+            if self._idle:
+                conn, returned_at = self._idle.pop()
+            elif len(self._born) + self._opening < self.maxconn:
+                conn, returned_at = _SLOT, None
+                self._opening += 1
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+                conn = None
+
+        if conn is None:
+            start = time.monotonic()
+            waiter.event.wait(timeout)
+            with self._lock:
+                self.counters["waits"] += 1
+                self.counters["wait_seconds"] += time.monotonic() - start
+                if waiter.handoff is None:
+                    self._waiters.remove(waiter)
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"no database connection free after {timeout:g}s "
+                        f"({self.maxconn} in use)"
+                    )
+            conn, returned_at = waiter.handoff
+            if conn is _SLOT and self._closed:
+                self._release_slot()
+                raise psycopg2.pool.PoolError("connection pool is closed")
+
+        if conn is not _SLOT:
+            if self._healthy(conn, returned_at):
+                return conn
+            # Replace it without giving up its slot
+            with self._lock:
+                self._close(conn)
+                self._opening += 1
+        try:
+            return self._connect(opening=True)
+        except BaseException:
+            self._release_slot()
+            raise
+
+    def putconn(self, conn, discard=False):
+        """
+        Returns `conn` to the pool. Open or aborted transactions are rolled
+        back; broken, closed or over-age connections are closed instead.
+        Whether a connection is broken is read from the connection itself
+        (closed, or transaction status unknown, or a failed rollback), not
+        from the error a caller hit: a deadlock or statement timeout leaves
+        a healthy connection behind.
+        """
+        if not discard and not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                    with self._lock:
+                        self.counters["rollbacks"] += 1
+                except psycopg2.Error:
+                    discard = True
+        with self._lock:
+            born = self._born.get(conn)
+            if born is None:
+                return  # not ours, or already discarded
+            expired = time.monotonic() - born > self.max_lifetime
+            if discard or conn.closed or expired or self._closed:
+                self._close(conn)
+                self._hand_slot()
+            elif self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.handoff = (conn, time.monotonic())
+                waiter.event.set()
+            else:
+                self._idle.append((conn, time.monotonic()))
+
+    # Lifecycle
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                self._close(self._idle.pop()[0])
+            while self._waiters:
+                self._hand_slot()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            size = len(self._born)
+            idle = len(self._idle)
+            stats.update(
+                size=size,
+                idle=idle,
+                in_use=size - idle,
+                waiting=len(self._waiters),
+                maxconn=self.maxconn,
+                utilization=round((size - idle) / self.maxconn, 4),
+            )
+        return stats
+
+    # Internals
+    def _connect(self, opening=False):
+        conn = psycopg2.connect(self.dsn)
+        with self._lock:
+            if opening:
+                self._opening -= 1
+            self._born[conn] = time.monotonic()
+            self.counters["created"] += 1
+        return conn
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            log.warning("Dropping dead pooled connection")
+            with self._lock:
+                self.counters["failed_checks"] += 1
+            return False
+
+    def _release_slot(self):
+        """Gives back a slot reserved for a connection that was never opened."""
+        with self._lock:
+            self._opening -= 1
+            self._hand_slot()
+
+    def _hand_slot(self):
+        # caller holds the lock; lets the oldest waiter open a connection
+        if self._waiters:
+            self._opening += 1
+            waiter = self._waiters.popleft()
+            waiter.handoff = (_SLOT, None)
+            waiter.event.set()
+
+    def _close(self, conn):
+        # caller holds the lock
+        self._born.pop(conn, None)
+        self.counters["discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -1,9 +1,20 @@
 #generate_ai_ebooks.py
 
 import os
+import sys
+import time
+import random
 import logging
+import argparse
+import itertools
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -12,13 +23,6 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(me
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-if not GEMINI_API_KEY:
-    raise EnvironmentError("GEMINI_API_KEY not found in environment.")
-
-# Configure Gemini API client
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-1.5-flash")
-
 # Constants
 THEMES = [
     "Space Adventure",
@@ -28,7 +32,30 @@ THEMES = [
     "Underwater City"
 ]
 OUTPUT_DIR = "ebooks"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+MODEL_NAME = "gemini-1.5-flash"
+AUTHOR_NAME = "Gemini AI"
+MAX_TITLE_LENGTH = 200  # books.title VARCHAR(200)
+
+# Errors worth retrying: rate limiting, timeouts and server-side hiccups
+TRANSIENT_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def get_model():
+    """
+    Configures the Gemini API client and returns the generative model.
+    """
+    if not GEMINI_API_KEY:
+        raise EnvironmentError("GEMINI_API_KEY not found in environment.")
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel(MODEL_NAME)
 
 
 def generate_unique_filename(base: str, extension: str, directory: str) -> str:
@@ -50,7 +77,7 @@ def build_prompt(theme: str) -> str:
     return f"Write a creative short story (~500 words) titled '{theme}'. It should be imaginative and suitable for general audiences."
 
 
-def generate_story(theme: str, index: int) -> str:
+def generate_story(model, theme: str, index: int) -> str:
     """
     Handles the story generation and file writing for a given theme.
     """
@@ -76,12 +103,264 @@ def generate_story(theme: str, index: int) -> str:
         return ""
 
 
-def main():
+# Batch mode
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` requests per second, bursts up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, then takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Checkpoint:
+    """
+    Append-only file of themes that are already committed to the database,
+    so an interrupted batch resumes where it stopped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+
+    def mark(self, themes):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for theme in themes:
+                f.write(theme + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(themes)
+
+
+class BookWriter:
+    """
+    Buffers generated stories and inserts them into `books` with multi-row
+    INSERTs, one transaction per batch. The checkpoint is only advanced after
+    the batch commits. Themes whose row the database rejects end up in `failed`.
+    """
+
+    def __init__(self, conn, checkpoint: Checkpoint, batch_size: int = 50,
+                 author: str = AUTHOR_NAME, genre: str = "Fiction"):
+        self.conn = conn
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.genre = genre
+        self.pending = []
+        self.inserted = 0
+        self.failed = []
+        self.author_id = self._author_id(author)
+
+    def _author_id(self, name):
+        with self.conn, self.conn.cursor() as cur:
+            cur.execute("SELECT author_id FROM authors WHERE name=%s", (name,))
+            row = cur.fetchone()
+            if row:
+                return row[0]
+            cur.execute("INSERT INTO authors(name) VALUES(%s) RETURNING author_id", (name,))
+            return cur.fetchone()[0]
+
+    def add(self, theme: str, story: str):
+        self.pending.append((theme, story))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Inserts the pending stories. If the batch is rejected, its rows are
+        retried one per transaction, so a bad row only fails its own theme.
+        The buffer is cleared either way; a lost connection is re-raised.
+        """
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            self._insert(batch)
+        except (psycopg2.Error, ValueError) as e:  # ValueError: NUL in a string
+            if self.conn.closed:
+                raise
+            logging.warning(f"⚠️  Batch of {len(batch)} stories failed ({str(e).strip()}); inserting one at a time")
+            for theme, story in batch:
+                try:
+                    self._insert([(theme, story)])
+                except (psycopg2.Error, ValueError) as e:
+                    if self.conn.closed:
+                        raise
+                    logging.error(f"❌ Could not insert story for '{theme}': {str(e).strip()}")
+                    self.failed.append(theme)
+
+    def _insert(self, stories):
+        rows = [(theme, story, self.genre, self.author_id) for theme, story in stories]
+        with self.conn, self.conn.cursor() as cur:
+            execute_values(
+                cur,
+                "INSERT INTO books(title, content, genre, published_date, author_id) VALUES %s",
+                rows,
+                template="(%s, %s, %s, CURRENT_DATE, %s)",
+                page_size=len(rows)
+            )
+        self.checkpoint.mark([theme for theme, _ in stories])
+        self.inserted += len(rows)
+        logging.info(f"💾 Inserted {len(rows)} stories ({self.inserted} total)")
+
+
+def generate_with_retry(model, theme: str, bucket: TokenBucket, retries: int = 4,
+                        backoff: float = 2.0) -> str:
+    """
+    Rate-limited Gemini call; transient errors are retried with exponential backoff.
+    """
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            return model.generate_content(build_prompt(theme)).text.strip()
+        except TRANSIENT_ERRORS as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * random.uniform(0.8, 1.2)
+            logging.warning(f"⏳ '{theme}' attempt {attempt + 1} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def read_themes(source: str):
+    """
+    Reads one theme per line from a file path or '-' for stdin, dropping blanks
+    and duplicates while keeping the original order. Themes too long to be a
+    book title are skipped with a warning.
+    """
+    stream = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    try:
+        themes = [line.strip() for line in stream]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    for theme in themes:
+        if len(theme) > MAX_TITLE_LENGTH:
+            logging.warning(f"⚠️  Skipping theme longer than {MAX_TITLE_LENGTH} characters: '{theme[:60]}...'")
+    return list(dict.fromkeys(t for t in themes if t and len(t) <= MAX_TITLE_LENGTH))
+
+
+def run_batch(themes, model, writer: BookWriter, concurrency: int = 4,
+              bucket: TokenBucket = None, retries: int = 4) -> dict:
+    """
+    Generates every theme not yet in the checkpoint, `concurrency` at a time,
+    and hands finished stories to `writer`. Returns a summary of the run.
+    At most 2 * concurrency themes are submitted ahead, so an interrupted run
+    (Ctrl-C, a lost connection) cancels the rest instead of paying for them;
+    stories that did finish are still written and checkpointed.
+    """
+    bucket = bucket or TokenBucket(rate=1.0, burst=concurrency)
+    todo = [t for t in themes if t not in writer.checkpoint.done]
+    skipped = len(themes) - len(todo)
+    if skipped:
+        logging.info(f"⏭️  Skipping {skipped} themes already in the checkpoint")
+
+    failed = []
+    remaining = iter(todo)
+    in_flight = {}
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def collect(future):
+        theme = in_flight.pop(future)
+        try:
+            story = future.result()
+        except Exception as e:
+            logging.error(f"❌ Error generating story for '{theme}': {e}")
+            failed.append(theme)
+            return
+        writer.add(theme, story)
+
+    try:
+        while True:
+            for theme in itertools.islice(remaining, 2 * concurrency - len(in_flight)):
+                in_flight[pool.submit(generate_with_retry, model, theme, bucket, retries)] = theme
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                collect(future)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        if not writer.conn.closed:
+            # Interrupted: keep what already finished, drop what was cancelled
+            for future in [f for f in in_flight if f.done() and not f.cancelled()]:
+                collect(future)
+            writer.flush()
+        if in_flight:
+            logging.warning(f"🛑 Stopped with {len(in_flight)} themes unfinished; they run again next time")
+    failed += writer.failed
+    return {"generated": len(todo) - len(failed), "skipped": skipped, "failed": failed}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate AI eBooks with Gemini.")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="themes file (one per line, '-' for stdin); inserts straight into the database")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel Gemini requests")
+    parser.add_argument("--rate", type=float, default=1.0, help="max requests per second")
+    parser.add_argument("--burst", type=int, default=None, help="token bucket size (default: concurrency)")
+    parser.add_argument("--retries", type=int, default=4, help="retries per theme on transient errors")
+    parser.add_argument("--batch-size", type=int, default=50, help="stories per INSERT transaction")
+    parser.add_argument("--checkpoint", help="progress file (default: <FILE>.checkpoint)")
+    parser.add_argument("--genre", default="Fiction")
+    return parser.parse_args(argv)
+
+
+def batch_main(args):
+    dsn = os.getenv("DATABASE_URL", "")
+    if dsn.startswith("postgres://"):
+        dsn = dsn.replace("postgres://", "postgresql://", 1)
+    if not dsn:
+        raise EnvironmentError("DATABASE_URL not found in environment.")
+
+    themes = read_themes(args.batch)
+    checkpoint = Checkpoint(args.checkpoint or
+                            ("stdin.checkpoint" if args.batch == "-" else f"{args.batch}.checkpoint"))
+    conn = psycopg2.connect(dsn)
+    try:
+        writer = BookWriter(conn, checkpoint, args.batch_size, genre=args.genre)
+        bucket = TokenBucket(args.rate, args.burst or args.concurrency)
+        logging.info(f"📘 Batch generating {len(themes)} themes "
+                     f"({args.concurrency} concurrent, {args.rate:g} req/s)")
+        summary = run_batch(themes, get_model(), writer, args.concurrency, bucket, args.retries)
+    finally:
+        conn.close()
+    logging.info(f"📚 Done: {summary['generated']} generated, {summary['skipped']} skipped, "
+                 f"{len(summary['failed'])} failed")
+    return 1 if summary["failed"] else 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.batch:
+        return batch_main(args)
+
+    model = get_model()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     logging.info("📘 Starting AI eBook generation...")
     for i, theme in enumerate(THEMES, start=1):
-        generate_story(theme, i)
+        generate_story(model, theme, i)
     logging.info(f"📚 All stories generated in '{OUTPUT_DIR}/'")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,386 @@
+#import_ebooks.py
+#===============================================
+#    Bulk importer for the ebooks/ corpus and other text dumps
+#    Purpose: Loads directories or archives of .txt files straight into `books`
+#    Notes:
+#    - Files stream through a generator pipeline: scan -> skip unchanged -> read
+#      -> hash -> COPY, one batch (--batch-size files / --batch-mb megabytes) at a time
+#    - Batches load on --jobs connections in parallel; computing the generated
+#      search_vector is most of the cost of an insert and runs on one core per
+#      connection. Rows go to a connection by content hash, so two connections
+#      never race to insert the same text
+#    - Memory is bounded by about two batches per connection, whatever the catalog size
+#    - Identical content is stored once (md5 dedupe against books.content_md5)
+#    - book_sources remembers where each book came from, so a re-run skips files
+#      whose size and mtime are unchanged and updates books whose file changed;
+#      it is looked up one batch of candidates at a time
+#
+#    Usage:
+#        python import_ebooks.py ebooks/
+#        python import_ebooks.py dump.tar.gz more_books.zip --author "Gemini AI" --jobs 8
+#===============================================
+
+import io
+import os
+import sys
+import time
+import hashlib
+import logging
+import argparse
+import tarfile
+import zipfile
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+load_dotenv()
+
+TEXT_EXTENSIONS = (".txt",)
+
+
+class SourceFile:
+    """
+    One candidate file: a stable source key, change markers and a way to read it.
+    """
+    __slots__ = ("source", "size", "mtime_ns", "read")
+
+    def __init__(self, source, size, mtime_ns, read):
+        self.source = source
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.read = read
+
+
+# Stage 1: scan
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def scan_directory(root):
+    """Yields every text file under `root` without building the full listing."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(TEXT_EXTENSIONS):
+                    st = entry.stat()
+                    yield SourceFile(
+                        os.path.abspath(entry.path), st.st_size, st.st_mtime_ns,
+                        lambda path=entry.path: read_file(path)
+                    )
+
+
+def scan_zip(path, stack):
+    # Members are read after the listing moves on, so the archive stays open
+    # until the caller's ExitStack closes it
+    zf = stack.enter_context(zipfile.ZipFile(path))
+    for info in zf.infolist():
+        if not info.is_dir() and info.filename.lower().endswith(TEXT_EXTENSIONS):
+            mtime = int(time.mktime(info.date_time + (0, 0, -1))) * 1_000_000_000
+            yield SourceFile(
+                f"{os.path.abspath(path)}!{info.filename}", info.file_size, mtime,
+                lambda info=info: zf.read(info)
+            )
+
+
+def scan_tar(path):
+    # Streaming mode: members are read in archive order, never seeked
+    with tarfile.open(path, "r|*") as tf:
+        for member in tf:
+            if member.isfile() and member.name.lower().endswith(TEXT_EXTENSIONS):
+                data = tf.extractfile(member).read()
+                yield SourceFile(
+                    f"{os.path.abspath(path)}!{member.name}", member.size,
+                    int(member.mtime) * 1_000_000_000, lambda data=data: data
+                )
+
+
+def scan(source, stack):
+    if os.path.isdir(source):
+        return scan_directory(source)
+    if zipfile.is_zipfile(source):
+        return scan_zip(source, stack)
+    if tarfile.is_tarfile(source):
+        return scan_tar(source)
+    raise ValueError(f"Not a directory or a zip/tar archive: {source}")
+
+
+def distinct_sources(sources):
+    """
+    Absolute paths of `sources` without repeats or directories inside another
+    given directory, so no file is scanned twice in one run.
+    """
+    paths = list(dict.fromkeys(os.path.abspath(s) for s in sources))
+    dirs = [os.path.join(p, "") for p in paths if os.path.isdir(p)]
+    return [p for p in paths
+            if not (os.path.isdir(p) and any(p.startswith(d) for d in dirs))]
+
+
+# Stage 2: skip unchanged files
+def known_sources(conn, sources):
+    """source -> (file_size, file_mtime_ns) for those of `sources` imported before."""
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT source, file_size, file_mtime_ns FROM book_sources WHERE source = ANY(%s)",
+            (sources,)
+        )
+        return {source: (size, mtime) for source, size, mtime in cur}
+
+
+def changed_files(files, conn, max_files, max_bytes, counts):
+    """
+    Yields lists of files that are new or whose (size, mtime) differ from the
+    last import, checking book_sources one batch of candidates at a time.
+    A source key repeated within a batch (a name added to an archive twice)
+    keeps its last copy.
+    """
+    for candidates in batched(files, max_files, max_bytes, size=lambda f: f.size):
+        latest = {f.source: f for f in candidates}
+        known = known_sources(conn, list(latest))
+        changed = [f for f in latest.values() if known.get(f.source) != (f.size, f.mtime_ns)]
+        counts["skipped"] += len(latest) - len(changed)
+        if changed:
+            yield changed
+
+
+# Stage 3: read, decode, hash
+def title_from_source(source):
+    """
+    'ebooks/book3_ancient_egypt.txt' -> 'Ancient Egypt'
+    """
+    stem = os.path.splitext(os.path.basename(source.split("!")[-1]))[0]
+    parts = stem.split("_")
+    if len(parts) > 1 and parts[0].lower().startswith("book") and parts[0][4:].isdigit():
+        parts = parts[1:]
+    return " ".join(p.capitalize() if p.islower() else p for p in parts if p)[:200] or stem[:200]
+
+
+def read_files(files):
+    """
+    Reads and hashes files; yields (source, title, text, md5, size, mtime_ns).
+    """
+    for f in files:
+        raw = f.read()
+        text = raw.decode("utf-8", errors="replace").replace("\x00", "")
+        md5 = hashlib.md5(text.encode("utf-8")).hexdigest()
+        yield f.source, title_from_source(f.source), text, md5, f.size, f.mtime_ns
+
+
+def batched(items, max_items, max_bytes, size=len):
+    batch, total = [], 0
+    for item in items:
+        batch.append(item)
+        total += size(item)
+        if len(batch) >= max_items or total >= max_bytes:
+            yield batch
+            batch, total = [], 0
+    if batch:
+        yield batch
+
+
+# Stage 4: load
+def copy_escape(value):
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class Importer:
+    """
+    Loads batches through a temp staging table with COPY, then merges them
+    into books / book_sources with set-based SQL in one transaction per batch.
+    One per connection; run() gives each its own worker thread.
+    """
+
+    def __init__(self, conn, author, genre):
+        self.conn = conn
+        self.genre = genre
+        self.totals = {"new": 0, "duplicate": 0, "updated": 0, "unchanged": 0}
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT author_id FROM authors WHERE name=%s", (author,))
+            row = cur.fetchone()
+            if not row:
+                cur.execute("INSERT INTO authors(name) VALUES(%s) RETURNING author_id", (author,))
+                row = cur.fetchone()
+            self.author_id = row[0]
+            # No index and uncompressed content: rows are written once, read once
+            # and copied into books, where they are compressed for good
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS import_stage (
+                    source TEXT,
+                    title VARCHAR(200),
+                    content TEXT,
+                    content_md5 CHAR(32),
+                    file_size BIGINT,
+                    file_mtime_ns BIGINT
+                ) ON COMMIT DELETE ROWS
+            """)
+            cur.execute("ALTER TABLE import_stage ALTER content SET STORAGE EXTERNAL")
+
+    def load(self, batch):
+        buf = io.StringIO()
+        for row in batch:
+            buf.write("\t".join(copy_escape(v) for v in row))
+            buf.write("\n")
+        buf.seek(0)
+
+        with self.conn, self.conn.cursor() as cur:
+            cur.copy_expert(
+                "COPY import_stage(source, title, content, content_md5, file_size, file_mtime_ns) "
+                "FROM STDIN", buf
+            )
+            cur.execute("ANALYZE import_stage")  # temp tables are never auto-analyzed
+            # A changed file whose book is shared with other sources gets its
+            # own book instead: forget the link and let it import as new below
+            cur.execute("""
+                DELETE FROM book_sources bs
+                 USING import_stage s
+                 WHERE bs.source = s.source AND bs.content_md5 <> s.content_md5
+                   AND EXISTS (SELECT 1 FROM book_sources other
+                                WHERE other.book_id = bs.book_id AND other.source <> bs.source)
+            """)
+            # Files seen before whose content changed: update the book in place
+            cur.execute("""
+                UPDATE books b SET content = s.content
+                  FROM import_stage s JOIN book_sources bs USING (source)
+                 WHERE b.book_id = bs.book_id AND bs.content_md5 <> s.content_md5
+            """)
+            updated = cur.rowcount
+            cur.execute("""
+                UPDATE book_sources bs
+                   SET content_md5 = s.content_md5, file_size = s.file_size,
+                       file_mtime_ns = s.file_mtime_ns
+                  FROM import_stage s
+                 WHERE bs.source = s.source
+            """)
+            seen = cur.rowcount
+            # New files with content we do not have yet (deduped within the batch too)
+            cur.execute("""
+                INSERT INTO books(title, content, genre, published_date, author_id)
+                SELECT DISTINCT ON (s.content_md5) s.title, s.content, %s, CURRENT_DATE, %s
+                  FROM import_stage s
+                 WHERE NOT EXISTS (SELECT 1 FROM book_sources bs WHERE bs.source = s.source)
+                   AND NOT EXISTS (SELECT 1 FROM books b WHERE b.content_md5 = s.content_md5)
+              ORDER BY s.content_md5, s.source
+            """, (self.genre, self.author_id))
+            new = cur.rowcount
+            # Record every new file against its (new or pre-existing) book
+            cur.execute("""
+                INSERT INTO book_sources(source, book_id, content_md5, file_size, file_mtime_ns)
+                SELECT s.source, b.book_id, s.content_md5, s.file_size, s.file_mtime_ns
+                  FROM import_stage s
+                  JOIN LATERAL (SELECT book_id FROM books
+                                 WHERE content_md5 = s.content_md5
+                              ORDER BY book_id LIMIT 1) b ON true
+                 WHERE NOT EXISTS (SELECT 1 FROM book_sources bs WHERE bs.source = s.source)
+                    ON CONFLICT (source) DO NOTHING
+            """)
+            linked = cur.rowcount
+
+        self.totals["new"] += new
+        self.totals["duplicate"] += linked - new
+        self.totals["updated"] += updated
+        self.totals["unchanged"] += seen - updated
+
+
+def run(sources, dsn, author="Unknown Author", genre="Fiction",
+        batch_size=2000, batch_mb=64, jobs=1):
+    """
+    Imports every text file in `sources` over `jobs` parallel connections;
+    returns a dict of counts.
+    """
+    conns = []
+    pools = []
+    try:
+        lookup = psycopg2.connect(dsn)
+        conns.append(lookup)
+        importers = []
+        for _ in range(jobs):
+            conns.append(psycopg2.connect(dsn))
+            importers.append(Importer(conns[-1], author, genre))
+            pools.append(ThreadPoolExecutor(max_workers=1))
+        in_flight = [deque() for _ in range(jobs)]
+        counts = {"skipped": 0}
+
+        def totals():
+            return {key: sum(i.totals[key] for i in importers) for key in importers[0].totals}
+
+        start = time.perf_counter()
+        files = 0
+        for source in distinct_sources(sources):
+            with contextlib.ExitStack() as stack:
+                for chunk in changed_files(scan(source, stack), lookup, batch_size,
+                                           batch_mb * 1024 * 1024, counts):
+                    shards = [[] for _ in range(jobs)]
+                    for row in read_files(chunk):
+                        shards[int(row[3][:8], 16) % jobs].append(row)
+                    for i, shard in enumerate(shards):
+                        if not shard:
+                            continue
+                        # At most one batch queued behind the one loading, per connection
+                        if len(in_flight[i]) >= 2:
+                            in_flight[i].popleft().result()
+                        in_flight[i].append(pools[i].submit(importers[i].load, shard))
+                    files += len(chunk)
+                    elapsed = time.perf_counter() - start
+                    t = totals()
+                    logging.info(
+                        f"📥 {files + counts['skipped']:,} files "
+                        f"({t['new']:,} new, {t['duplicate']:,} duplicate, "
+                        f"{t['updated']:,} updated, {counts['skipped']:,} skipped) "
+                        f"{files / elapsed * 60:,.0f} files/min"
+                    )
+        for futures in in_flight:
+            while futures:
+                futures.popleft().result()
+
+        result = totals()
+        result["unchanged"] += counts["skipped"]
+        result["seconds"] = round(time.perf_counter() - start, 2)
+        return result
+    finally:
+        for pool in pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+        for conn in conns:
+            conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import text files into the books table.")
+    parser.add_argument("sources", nargs="+", help="directories, .zip or .tar(.gz/.bz2/.xz) archives")
+    parser.add_argument("--author", default="Unknown Author", help="author for new books")
+    parser.add_argument("--genre", default="Fiction", help="genre for new books")
+    parser.add_argument("--batch-size", type=int, default=2000, help="max files per COPY batch")
+    parser.add_argument("--batch-mb", type=int, default=64, help="max text megabytes per batch")
+    parser.add_argument("--jobs", type=int, default=min(4, os.cpu_count() or 1),
+                        help="parallel database connections (default: CPUs, up to 4)")
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL", ""),
+                        help="Postgres connection string (default: $DATABASE_URL)")
+    args = parser.parse_args(argv)
+
+    dsn = args.dsn
+    if dsn.startswith("postgres://"):
+        dsn = dsn.replace("postgres://", "postgresql://", 1)
+    if not dsn:
+        raise EnvironmentError("DATABASE_URL not found in environment.")
+
+    totals = run(args.sources, dsn, args.author, args.genre, args.batch_size, args.batch_mb,
+                 max(1, args.jobs))
+    logging.info(
+        f"📚 Import finished in {totals['seconds']}s: {totals['new']} new, "
+        f"{totals['duplicate']} duplicate, {totals['updated']} updated, "
+        f"{totals['unchanged']} unchanged"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+#jobs.py
+#===============================================
+#    Background job queue backed by the Postgres jobs table
+#    Purpose: Runs slow Gemini / TTS work outside of the request workers
+#    Notes:
+#    - Jobs are rows in `jobs`, so queued and in-flight work survives restarts
+#    - Workers claim rows with FOR UPDATE SKIP LOCKED, safe across processes
+#    - A running job holds a lease; if its worker dies the lease expires and
+#      another worker picks it up again, until max_attempts is used up
+#    - Failures retry with exponential backoff until max_attempts is reached
+#===============================================
+
+import random
+import contextlib
+import threading
+import logging
+
+from psycopg2.extras import Json
+
+log = logging.getLogger(__name__)
+
+JOB_COLUMNS = (
+    "job_id", "kind", "status", "progress", "attempts", "max_attempts",
+    "payload", "result", "error", "created_at", "updated_at"
+)
+
+
+class Job:
+    """
+    Handle passed to a job handler: payload plus a progress callback.
+    """
+
+    def __init__(self, queue, job_id, kind, payload, attempt):
+        self.queue = queue
+        self.job_id = job_id
+        self.kind = kind
+        self.payload = payload
+        self.attempt = attempt
+
+    def progress(self, fraction):
+        """Records progress (0.0 - 1.0) and renews the worker's lease."""
+        self.queue._update_progress(self.job_id, fraction)
+
+
+class JobQueue:
+    """
+    Persistent job queue with a small in-process worker pool.
+
+    `cursor_factory` is a context manager yielding a DB cursor and committing
+    on exit (app.db_cursor). Handlers are registered per job kind and receive a
+    `Job`; whatever JSON-serializable value they return is stored as the result.
+    `context`, if given, returns a context manager that worker threads enter
+    around each claim and run (e.g. Flask's app.app_context).
+    """
+
+    def __init__(self, cursor_factory, workers=2, poll_interval=1.0,
+                 lease_seconds=300, backoff_base=5.0, backoff_max=600.0, context=None):
+        self._cursor = cursor_factory
+        self._context = context or contextlib.nullcontext
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._handlers = {}
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+
+    # Registration & submission
+    def handler(self, kind, max_attempts=3):
+        """Decorator registering `fn(job)` as the handler for `kind`."""
+        def register(fn):
+            self._handlers[kind] = (fn, max_attempts)
+            return fn
+        return register
+
+    def enqueue(self, kind, payload, dedupe_key=None):
+        """
+        Adds a job and returns its id. If `dedupe_key` matches a job that is
+        still queued or running, that job's id is returned instead.
+        """
+        _, max_attempts = self._handlers[kind]
+        row = None
+        while not row:
+            with self._cursor() as cur:
+                cur.execute(
+                    "INSERT INTO jobs(kind, payload, dedupe_key, max_attempts) "
+                    "VALUES(%s, %s, %s, %s) "
+                    "ON CONFLICT (dedupe_key) WHERE status IN ('queued', 'running') DO NOTHING "
+                    "RETURNING job_id",
+                    (kind, Json(payload), dedupe_key, max_attempts)
+                )
+                row = cur.fetchone()
+                if not row:
+                    # The matching job may finish between the two statements; retry
+                    cur.execute(
+                        "SELECT job_id FROM jobs "
+                        "WHERE dedupe_key = %s AND status IN ('queued', 'running')",
+                        (dedupe_key,)
+                    )
+                    row = cur.fetchone()
+        self._wake.set()
+        return row[0]
+
+    def get(self, job_id):
+        """Returns a job as a dict, or None if it does not exist."""
+        with self._cursor() as cur:
+            cur.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id = %s",
+                (job_id,)
+            )
+            row = cur.fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    # Worker side
+    def claim(self):
+        """
+        Locks the next runnable job (queued and due, or running with an
+        expired lease) and marks it running. Returns a `Job` or None.
+        Expired jobs that have used up max_attempts (their worker kept dying,
+        e.g. OOM-killed) are marked failed instead of being retried forever.
+        """
+        with self._cursor() as cur:
+            cur.execute(
+                "UPDATE jobs SET status = 'failed', locked_until = NULL, updated_at = now(), "
+                "error = 'Worker stopped responding (lease expired) on the last attempt' "
+                "WHERE status = 'running' AND locked_until < now() AND attempts >= max_attempts"
+            )
+            if cur.rowcount:
+                log.warning("Failed %s job(s) whose lease expired on their last attempt", cur.rowcount)
+            cur.execute(
+                """
+                UPDATE jobs
+                   SET status = 'running',
+                       attempts = attempts + 1,
+                       locked_until = now() + make_interval(secs => %s),
+                       updated_at = now()
+                 WHERE job_id = (
+                        SELECT job_id FROM jobs
+                         WHERE (status = 'queued' AND run_after <= now())
+                            OR (status = 'running' AND locked_until < now()
+                                AND attempts < max_attempts)
+                      ORDER BY run_after, job_id
+                         LIMIT 1
+                           FOR UPDATE SKIP LOCKED)
+             RETURNING job_id, kind, payload, attempts
+                """,
+                (self.lease_seconds,)
+            )
+            row = cur.fetchone()
+        return Job(self, *row) if row else None
+
+    def run_once(self):
+        """
+        Claims and runs a single job. Returns False when nothing was runnable.
+        """
+        job = self.claim()
+        if job is None:
+            return False
+
+        fn, max_attempts = self._handlers.get(job.kind, (None, 0))
+        try:
+            if fn is None:
+                raise LookupError(f"No handler registered for job kind '{job.kind}'")
+            result = fn(job)
+        except Exception as e:
+            log.exception("Job %s (%s) failed on attempt %s", job.job_id, job.kind, job.attempt)
+            self._fail(job, max_attempts, e)
+        else:
+            with self._cursor() as cur:
+                cur.execute(
+                    "UPDATE jobs SET status = 'done', progress = 1, result = %s, "
+                    "error = NULL, locked_until = NULL, updated_at = now() "
+                    "WHERE job_id = %s",
+                    (Json(result), job.job_id)
+                )
+            log.info("Job %s (%s) done", job.job_id, job.kind)
+        return True
+
+    def _fail(self, job, max_attempts, error):
+        if job.attempt >= max_attempts:
+            sql = ("UPDATE jobs SET status = 'failed', error = %s, locked_until = NULL, "
+                   "updated_at = now() WHERE job_id = %s")
+            params = (str(error), job.job_id)
+        else:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (job.attempt - 1))
+            delay *= random.uniform(0.8, 1.2)
+            sql = ("UPDATE jobs SET status = 'queued', error = %s, locked_until = NULL, "
+                   "run_after = now() + make_interval(secs => %s), updated_at = now() "
+                   "WHERE job_id = %s")
+            params = (str(error), delay, job.job_id)
+        with self._cursor() as cur:
+            cur.execute(sql, params)
+
+    def _update_progress(self, job_id, fraction):
+        with self._cursor() as cur:
+            cur.execute(
+                "UPDATE jobs SET progress = %s, "
+                "locked_until = now() + make_interval(secs => %s), updated_at = now() "
+                "WHERE job_id = %s",
+                (max(0.0, min(1.0, fraction)), self.lease_seconds, job_id)
+            )
+
+    # Thread pool
+    def start(self):
+        """Starts the worker threads (daemon threads, one queue per process)."""
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for i in range(self.workers):
+                t = threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                with self._context():
+                    ran = self.run_once()
+            except Exception:
+                log.exception("Job worker error")
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
@@ -0,0 +1,341 @@
+#metrics.py
+#===============================================
+#    Request metrics and opt-in profiling
+#    Purpose: Shows where request time goes: routes, database, TTS, GCS and Gemini
+#    Notes:
+#    - Histograms and counters live in REGISTRY, rendered in Prometheus text format
+#    - span() / timed() time one dependency call; the request's RequestTrace (if
+#      any) also counts it per request and, when profiling, builds a call tree
+#    - With profiling off a span costs two clock reads and a histogram update
+#    - Per-request histograms go through observe_later(): requests only queue
+#      their values and the scrape buckets them (or every PENDING_MAX requests)
+#    - Traces follow contextvars, so work handed to thread pools is measured in
+#      the histograms but not attributed to the request
+#===============================================
+
+import time
+import bisect
+import functools
+import threading
+from collections import deque
+from contextvars import ContextVar
+
+import psycopg2.extensions
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = tuple(4 ** n for n in range(3, 14))  # 64 B .. 64 MB
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PENDING_MAX = 8192  # queued observe_later() batches; a scrape normally buckets them first
+
+
+class Histogram:
+    """
+    Cumulative-on-render histogram; callers hold the registry lock.
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    __slots__ = ("kind", "help", "labels", "buckets", "series")
+
+    def __init__(self, kind, help, labels, buckets=None):
+        self.kind = kind
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> Histogram | number
+
+
+class Registry:
+    """
+    Named, labelled histograms and counters plus collector callbacks for values
+    owned elsewhere (cache stats, pool stats). Label values are passed
+    positionally, in the order the metric declared its label names.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+        self._pending = deque()  # observe_later() batches not yet in their histograms
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self._metrics.setdefault(name, Metric("histogram", help, labels, buckets))
+
+    def counter(self, name, help, labels=()):
+        self._metrics.setdefault(name, Metric("counter", help, labels))
+
+    def add_collector(self, fn):
+        """`fn()` yields (name, kind, help, value) tuples at render time."""
+        self._collectors.append(fn)
+
+    def observe(self, name, value, *labels):
+        metric = self._metrics[name]
+        with self._lock:
+            hist = metric.series.get(labels)
+            if hist is None:
+                hist = metric.series[labels] = Histogram(metric.buckets)
+            hist.observe(value)
+
+    def series(self, name, *labels):
+        """
+        The histogram for one set of label values, created on first use. Hot
+        paths keep it and record through observe_later().
+        """
+        metric = self._metrics[name]
+        with self._lock:
+            hist = metric.series.get(labels)
+            if hist is None:
+                hist = metric.series[labels] = Histogram(metric.buckets)
+            return hist
+
+    def observe_later(self, histograms, values):
+        """
+        Queues values for the matching histograms, e.g. one request's. They
+        are bucketed together at the next render() or once PENDING_MAX batches
+        are waiting, so the caller only pays for a deque append, which needs
+        no lock. `values` may be shorter than `histograms`; the rest are left
+        alone.
+        """
+        self._pending.append((histograms, values))
+        if len(self._pending) >= PENDING_MAX:
+            with self._lock:
+                self._flush()
+
+    def _flush(self):
+        # callers hold the lock; appends may continue meanwhile
+        pending = self._pending
+        for _ in range(len(pending)):
+            histograms, values = pending.popleft()
+            for hist, value in zip(histograms, values):
+                # Histogram.observe() inlined: this runs a few thousand times a flush
+                hist.counts[bisect.bisect_left(hist.buckets, value)] += 1
+                hist.sum += value
+                hist.count += 1
+
+    def inc(self, name, *labels, value=1):
+        series = self._metrics[name].series
+        with self._lock:
+            series[labels] = series.get(labels, 0) + value
+
+    def render(self):
+        """Everything in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            self._flush()
+            for name, metric in sorted(self._metrics.items()):
+                lines += [f"# HELP {name} {metric.help}", f"# TYPE {name} {metric.kind}"]
+                for values, value in sorted(metric.series.items()):
+                    pairs = list(zip(metric.labels, values))
+                    if metric.kind == "histogram":
+                        cumulative = 0
+                        for bound, n in zip(value.buckets + ("+Inf",), value.counts):
+                            cumulative += n
+                            lines.append(f"{name}_bucket{_labels(pairs + [('le', bound)])} {cumulative}")
+                        lines.append(f"{name}_sum{_labels(pairs)} {value.sum:.6f}")
+                        lines.append(f"{name}_count{_labels(pairs)} {value.count}")
+                    else:
+                        lines.append(f"{name}{_labels(pairs)} {value}")
+        for collect in self._collectors:
+            for name, kind, help, value in collect():
+                if value is not None:
+                    lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+REGISTRY = Registry()
+REGISTRY.histogram("http_request_duration_seconds", "Time to build the response, by route",
+                   ("route", "method", "status"))
+REGISTRY.histogram("http_request_db_queries", "Database queries per request, by route",
+                   ("route",), COUNT_BUCKETS)
+REGISTRY.histogram("http_response_size_bytes", "Response body size when known, by route",
+                   ("route",), SIZE_BUCKETS)
+REGISTRY.histogram("dependency_duration_seconds", "Latency of database, TTS, GCS and Gemini calls",
+                   ("dependency", "operation"))
+REGISTRY.histogram("dependency_payload_bytes", "Payload size of dependency calls",
+                   ("dependency", "operation"), SIZE_BUCKETS)
+REGISTRY.counter("dependency_errors_total", "Dependency calls that raised", ("dependency", "operation"))
+
+
+# Per-request tracing
+class Node:
+    __slots__ = ("name", "duration", "bytes", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.duration = 0.0
+        self.bytes = None
+        self.children = []
+
+
+class RequestTrace:
+    """
+    Per-request dependency totals; with `profile` also the nested call tree.
+    """
+
+    __slots__ = ("profile", "start", "totals", "root", "_stack", "_token")
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.start = time.perf_counter()
+        self.totals = {}  # (dependency, operation) -> [calls, seconds]
+        self.root = Node("request") if profile else None
+        self._stack = [self.root] if profile else None
+
+    def calls(self, dependency, operation):
+        return self.totals.get((dependency, operation), (0, 0.0))[0]
+
+    def push(self, name):
+        node = Node(name)
+        self._stack[-1].children.append(node)
+        self._stack.append(node)
+        return node
+
+    def record(self, dependency, operation, elapsed, node=None, size=None):
+        total = self.totals.setdefault((dependency, operation), [0, 0.0])
+        total[0] += 1
+        total[1] += elapsed
+        if node is not None:
+            node.duration = elapsed
+            node.bytes = size
+            self._stack.pop()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self, elapsed):
+        """Server-Timing header value: one entry per dependency operation."""
+        parts = [
+            f'{dep}.{op};dur={seconds * 1000:.2f};desc="{calls}x"'
+            for (dep, op), (calls, seconds) in sorted(self.totals.items())
+        ]
+        return ", ".join(parts + [f"total;dur={elapsed * 1000:.2f}"])
+
+    def format_tree(self, title, elapsed):
+        """Indented call tree, repeated calls folded into one line with a count."""
+        self.root.duration = elapsed
+        lines = [f"{title} {elapsed * 1000:.2f} ms"]
+        _format_children([self.root], 1, lines)
+        return "\n".join(lines)
+
+
+def _format_children(parents, depth, lines):
+    groups = {}
+    for parent in parents:
+        for child in parent.children:
+            groups.setdefault(child.name, []).append(child)
+    spent = 0.0
+    for name, nodes in groups.items():
+        total = sum(n.duration for n in nodes)
+        spent += total
+        size = sum(n.bytes or 0 for n in nodes)
+        line = f"{'  ' * depth}{name}"
+        if len(nodes) > 1:
+            line += f" x{len(nodes)}"
+        line += f" {total * 1000:.2f} ms"
+        if size:
+            line += f" ({size} bytes)"
+        lines.append(line)
+        _format_children(nodes, depth + 1, lines)
+    if groups:
+        own = sum(p.duration for p in parents) - spent
+        lines.append(f"{'  ' * depth}(self) {own * 1000:.2f} ms")
+
+
+_current = ContextVar("request_trace", default=None)
+
+
+def begin_trace(profile=False):
+    """Starts a trace for the current request and returns it."""
+    trace = RequestTrace(profile)
+    trace._token = _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+def end_trace():
+    trace = _current.get()
+    if trace is not None:
+        _current.reset(trace._token)
+
+
+class span:
+    """
+    Times one dependency call: `with span("db", "query"): ...`.
+    Set `.bytes` inside the block to record a payload size.
+    """
+    __slots__ = ("dependency", "operation", "bytes", "_start", "_trace", "_node")
+
+    def __init__(self, dependency, operation):
+        self.dependency = dependency
+        self.operation = operation
+        self.bytes = None
+        self._node = None
+
+    def __enter__(self):
+        self._trace = trace = _current.get()
+        if trace is not None and trace.profile:
+            self._node = trace.push(f"{self.dependency}.{self.operation}")
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        REGISTRY.observe("dependency_duration_seconds", elapsed, self.dependency, self.operation)
+        if exc_type is not None:
+            REGISTRY.inc("dependency_errors_total", self.dependency, self.operation)
+        if self.bytes is not None:
+            REGISTRY.observe("dependency_payload_bytes", self.bytes, self.dependency, self.operation)
+        if self._trace is not None:
+            self._trace.record(self.dependency, self.operation, elapsed, self._node, self.bytes)
+        return False
+
+
+def timed(dependency, operation, size=None):
+    """
+    Decorator form of span(); `size(result)` gives the payload size to record.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(dependency, operation) as s:
+                result = fn(*args, **kwargs)
+                if size is not None:
+                    s.bytes = size(result)
+                return result
+        return wrapper
+    return decorate
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """
+    psycopg2 cursor whose execute() calls are timed as ("db", "query").
+    """
+
+    def execute(self, query, vars=None):
+        with span("db", "query"):
+            return super().execute(query, vars)
@@ -0,0 +1,123 @@
+-- schema.sql
+-- Full database schema for the AI eBook & Audiobook Library.
+-- Every statement is idempotent, so this file can be re-run against an
+-- existing database to pick up new tables and indexes:
+--     flask --app app init-db
+
+-- Authors Table
+CREATE TABLE IF NOT EXISTS Authors (
+    author_id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    bio TEXT
+);
+
+-- Users Table
+CREATE TABLE IF NOT EXISTS Users (
+    user_id SERIAL PRIMARY KEY,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    email VARCHAR(100) NOT NULL UNIQUE
+);
+
+-- Books Table
+CREATE TABLE IF NOT EXISTS Books (
+    book_id SERIAL PRIMARY KEY,
+    title VARCHAR(200) NOT NULL,
+    author_id INTEGER NOT NULL REFERENCES Authors(author_id),
+    genre VARCHAR(50),
+    published_date DATE,
+    content TEXT
+);
+
+-- Library listing index: keyset pagination on (published_date, book_id), newest first
+CREATE INDEX IF NOT EXISTS books_listing_idx
+    ON Books ((COALESCE(published_date, '-infinity'::date)) DESC, book_id DESC);
+
+-- Content version for ETag / Last-Modified on /read and /download_text.
+-- The trigger bumps it on any title or content edit, including hand-run SQL updates.
+ALTER TABLE Books ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+CREATE OR REPLACE FUNCTION books_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS books_touch_updated_at ON Books;
+CREATE TRIGGER books_touch_updated_at
+    BEFORE UPDATE OF title, content ON Books
+    FOR EACH ROW
+    WHEN (OLD.title IS DISTINCT FROM NEW.title OR OLD.content IS DISTINCT FROM NEW.content)
+    EXECUTE FUNCTION books_touch_updated_at();
+
+-- Full-text search over title (weight A) and content (weight B).
+-- A generated column, so Postgres keeps it in sync on every insert and content update.
+ALTER TABLE Books ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS books_search_idx ON Books USING GIN (search_vector);
+
+-- Title-only vector, so a search can pick title matches however old the book
+-- is, without reading the large search_vector of each candidate
+ALTER TABLE Books ADD COLUMN IF NOT EXISTS title_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(title, ''))) STORED;
+CREATE INDEX IF NOT EXISTS books_title_search_idx ON Books USING GIN (title_vector);
+
+-- Content hash so the bulk importer (import_ebooks.py) stores identical texts once
+ALTER TABLE Books ADD COLUMN IF NOT EXISTS content_md5 CHAR(32)
+    GENERATED ALWAYS AS (md5(content)) STORED;
+CREATE INDEX IF NOT EXISTS books_content_md5_idx ON Books (content_md5);
+
+-- Book Sources Table (file or archive member each imported book came from)
+-- Size and mtime let a re-run of import_ebooks.py skip unchanged files unread
+CREATE TABLE IF NOT EXISTS Book_Sources (
+    source TEXT PRIMARY KEY,
+    book_id INTEGER NOT NULL REFERENCES Books(book_id) ON DELETE CASCADE,
+    content_md5 CHAR(32) NOT NULL,
+    file_size BIGINT NOT NULL,
+    file_mtime_ns BIGINT NOT NULL,
+    imported_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS book_sources_book_idx ON Book_Sources (book_id);
+
+-- Reviews Table
+CREATE TABLE IF NOT EXISTS Reviews (
+    review_id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES Users(user_id),
+    book_id INTEGER NOT NULL REFERENCES Books(book_id),
+    rating INTEGER CHECK (rating BETWEEN 1 AND 10),
+    review_text TEXT,
+    review_date DATE DEFAULT CURRENT_DATE
+);
+
+-- Book Ratings Table (per-book review aggregates for the homepage)
+-- Maintained by submit_review(); backfill or repair with: flask --app app rebuild-ratings
+CREATE TABLE IF NOT EXISTS Book_Ratings (
+    book_id INTEGER PRIMARY KEY REFERENCES Books(book_id) ON DELETE CASCADE,
+    rating_sum BIGINT NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    last_review_date DATE
+);
+
+-- Jobs Table (background story generation and audio rendering)
+CREATE TABLE IF NOT EXISTS Jobs (
+    job_id SERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    dedupe_key VARCHAR(200),
+    status VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    progress REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+    locked_until TIMESTAMPTZ,
+    result JSONB,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS jobs_runnable_idx
+    ON Jobs (run_after, job_id) WHERE status IN ('queued', 'running');
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_dedupe_idx
+    ON Jobs (dedupe_key) WHERE status IN ('queued', 'running');
@@ -0,0 +1,122 @@
+#tts_pipeline.py
+#===============================================
+#    Chunked text-to-speech pipeline
+#    Purpose: Splits long books into TTS sized chunks and renders them in parallel
+#    Notes:
+#    - Chunks break on paragraph, then sentence, then word boundaries
+#    - A bounded thread pool renders chunks, results come back in reading order
+#    - MP3 chunks are plain frame streams, so they can be concatenated as they finish
+#===============================================
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Cloud TTS rejects requests over 5000 bytes of input
+MAX_CHUNK_BYTES = 4800
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+
+
+def _size(s):
+    return len(s.encode("utf-8"))
+
+
+def _hard_split(word, max_bytes):
+    """
+    Slices a single oversized token on character boundaries.
+    """
+    piece = ""
+    for ch in word:
+        if piece and _size(piece + ch) > max_bytes:
+            yield piece
+            piece = ""
+        piece += ch
+    if piece:
+        yield piece
+
+
+def _units(text, max_bytes):
+    """
+    Yields (separator, piece) pairs, each piece small enough for one request.
+    Splits as coarsely as possible: paragraph, sentence, word, then characters.
+    """
+    for para in _PARAGRAPH_RE.split(text):
+        para = para.strip()
+        if not para:
+            continue
+        if _size(para) <= max_bytes:
+            yield "\n\n", para
+            continue
+        sep = "\n\n"
+        for sentence in _SENTENCE_RE.split(para):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if _size(sentence) <= max_bytes:
+                yield sep, sentence
+                sep = " "
+                continue
+            for word in sentence.split():
+                for piece in _hard_split(word, max_bytes):
+                    yield sep, piece
+                    sep = " "
+
+
+def split_text(text, max_bytes=MAX_CHUNK_BYTES):
+    """
+    Packs `text` into as few chunks as possible, each at most `max_bytes` UTF-8 bytes.
+    """
+    chunks = []
+    current = ""
+    for sep, piece in _units(text, max_bytes):
+        candidate = f"{current}{sep}{piece}" if current else piece
+        if _size(candidate) <= max_bytes:
+            current = candidate
+        else:
+            chunks.append(current)
+            current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def strip_id3(data):
+    """
+    Drops a leading ID3v2 tag so concatenated chunks form one clean MP3 stream.
+    """
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = 0
+        for b in data[6:10]:
+            size = (size << 7) | (b & 0x7F)
+        footer = 10 if data[5] & 0x10 else 0
+        return data[10 + size + footer:]
+    return data
+
+
+def iter_synthesized(chunks, synth_chunk, max_workers=4):
+    """
+    Renders `chunks` with `synth_chunk(text) -> bytes` on a bounded pool.
+    Yields audio bytes in chunk order as soon as each one is ready, keeping at
+    most 2 * max_workers requests in flight.
+    """
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+    try:
+        pending = []
+        it = iter(chunks)
+        window = max_workers * 2
+        first = True
+        for chunk in it:
+            pending.append(pool.submit(synth_chunk, chunk))
+            if len(pending) >= window:
+                break
+        while pending:
+            data = pending.pop(0).result()
+            yield data if first else strip_id3(data)
+            first = False
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append(pool.submit(synth_chunk, nxt))
+    finally:
+        # Client disconnects close the generator early; drop queued work
+        pool.shutdown(wait=False, cancel_futures=True)